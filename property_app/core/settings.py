@@ -42,7 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.throttling.LoadSheddingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'listings.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,6 +84,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/ref/settings/#caches
+# Shared by every process on this host (web workers, run_worker, management commands), so cache invalidation,
+# single-flight locks and throttle buckets reach all of them. Use redis / memcached when serving from several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -123,8 +139,81 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Media serving (listings.views_media.serve_media)
+# uuid-named property images get an immutable far-future Cache-Control; anything else gets this max-age.
+MEDIA_CACHE_MAX_AGE = 3600
+# None: python streams the file. "X-Sendfile" (apache/lighttpd) or "X-Accel-Redirect" (nginx): the front server does.
+MEDIA_SENDFILE_HEADER = None
+# internal nginx location that maps onto MEDIA_ROOT, used with X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+
+# Output of `manage.py publish_static` (pre-rendered JSON for the front web server)
+STATIC_PUBLISH_ROOT = BASE_DIR / "publish"
+# url the front server serves STATIC_PUBLISH_ROOT under (runserver does it too when DEBUG); None: home.js uses the api
+STATIC_PUBLISH_URL = "/published/"
+
+# Detail page slug -> property id cache (listings.slug_cache): an LRU per worker process,
+# checked against a generation counter in the shared cache that every Property / Location change bumps
+SLUG_CACHE_MAX_ENTRIES = 10000
+SLUG_CACHE_TTL = 300 # seconds
+SLUG_CACHE_NEGATIVE_TTL = 30 # seconds a "no such property" answer is remembered
+
+# Search / autocomplete result cache with single-flight computation (listings.coalescing)
+SEARCH_CACHE_ALIAS = "default" # must be shared by all processes, data changes made by commands / the worker invalidate it
+SEARCH_CACHE_TTL = 60 # seconds a result is fresh
+SEARCH_CACHE_STALE_TTL = 0 # seconds an expired result may still be served while it refreshes (0 disables)
+SEARCH_CACHE_LOCK_TIMEOUT = 10 # seconds other requests wait for the one computing a key
+
+# /api/locations/index/ (client side autocomplete)
+LOCATION_INDEX_MAX_ENTRIES = 5000 # above this the index is left empty and clients use the server autocomplete
+LOCATION_INDEX_MAX_AGE = 300 # seconds, for requests without ?v=<version>
+
+# Response compression (listings.compression.CompressionMiddleware): gzip always, brotli / zstd when installed
+COMPRESSION_MIN_SIZE = 512 # bytes; smaller bodies gain nothing from compressing
+
+# Background jobs (listings.jobs, processed by `manage.py run_worker`)
+IMAGE_PROCESSING_IN_BACKGROUND = True # compute image placeholders in the worker instead of during the upload request
+JOB_BATCH_SIZE = 50 # csv rows committed per transaction by background imports
+JOB_RETRY_DELAY = 30 # seconds before the first retry, doubled on every further attempt
+JOB_STALE_AFTER = 300 # seconds without heartbeat before a running job is handed to another worker
+
+# Throttling (listings.throttling): token buckets in the default cache, per "<basename>.<action>" scope.
+# (tokens refilled per second, bucket size); scopes without an entry use "default".
+THROTTLE_CLIENT_BUDGETS = {
+    "default": (10, 40),
+    "locations.autocomplete": (5, 20),
+    "locations.index": (1, 10),
+    "properties.list": (5, 20),
+    "properties.batch": (1, 5),
+}
+THROTTLE_GLOBAL_BUDGETS = {
+    "default": (200, 400),
+    "locations.autocomplete": (100, 200),
+    "properties.list": (100, 200),
+}
+# Bucket updates are flock'ed on this file, so the worker processes of a host can't lose each other's updates.
+# None: only threads are serialized, and each process can end up spending a whole global budget.
+THROTTLE_LOCK_FILE = BASE_DIR / "cache" / "throttle.lock"
+THROTTLE_DEEP_PAGE_STEP = 10 # every 10 pages deeper costs one more token, up to the scope's burst
+# Load shedding (listings.throttling.LoadSheddingMiddleware): API requests that waited longer than this in the
+# server's queue get an immediate 503. Needs the front server to stamp requests, nginx:
+#   proxy_set_header X-Request-Start "t=${msec}";
+LOAD_SHED_MAX_QUEUE_MS = 500
+# Cap on requests in progress per process. Sync / threaded wsgi workers never exceed their thread count anyway,
+# so it only matters under asgi; None disables it.
+LOAD_SHED_MAX_IN_FLIGHT = None
+LOAD_SHED_RETRY_AFTER = 1 # seconds
+LOAD_SHED_EXEMPT_PATHS = ("/api/metrics/",) # monitoring keeps answering under load
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 8,
+    "DEFAULT_THROTTLE_CLASSES": [
+        "listings.throttling.ClientTokenBucketThrottle",
+        "listings.throttling.GlobalTokenBucketThrottle",
+    ],
     "EXCEPTION_HANDLER": "listings.exceptions.api_exception_handler",
+    # reverse proxies in front of Django (1 behind nginx). Client ips for throttling are read from X-Forwarded-For
+    # only that far; 0 uses REMOTE_ADDR, so clients can't pick their own ip (and budget) with the header
+    "NUM_PROXIES": 0,
 }
@@ -1,14 +1,27 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 from django.conf import settings
-from django.conf.urls.static import static
+from django.views.static import serve
+
+from listings.views_media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('listings.urls')),
-    path('', include("listings.urls_pages"))
+    path('', include("listings.urls_pages")),
+    # served in every mode (not only DEBUG): validators, ranges and optional sendfile offload
+    re_path(r"^%s(?P<path>.+)$" % re.escape(settings.MEDIA_URL.lstrip("/")), serve_media, name="media"),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# published payloads are the front server's job in production (see README "Static Publishing")
+if settings.DEBUG and getattr(settings, "STATIC_PUBLISH_URL", None):
+    urlpatterns += [
+        re_path(
+            r"^%s(?P<path>.+)$" % re.escape(settings.STATIC_PUBLISH_URL.lstrip("/")),
+            serve,
+            {"document_root": settings.STATIC_PUBLISH_ROOT},
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
-from .models import Location, Property, PropertyImage
+from django.utils import timezone
+from .models import Job, Location, Property, PropertyImage
 
 # Register your models here.
 
@@ -34,4 +35,48 @@ class PropertyAdmin(admin.ModelAdmin):
         primary_count = obj.images.filter(is_primary = True).count()
 
         if primary_count > 1:
-            return ValidationError("Select only one primary image for a property")
\ No newline at end of file
+            return ValidationError("Select only one primary image for a property")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "progress", "message", "attempts", "cancel_requested", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    ordering = ("-created_at",)
+    readonly_fields = (
+        "kind", "payload", "status", "progress_done", "progress_total", "message", "error", "attempts",
+        "cancel_requested", "run_after", "worker", "heartbeat_at", "created_at", "started_at", "finished_at",
+    )
+    actions = ["cancel_jobs", "retry_jobs"]
+
+    def has_add_permission(self, request):
+        # jobs are created by the code that needs them (seed_from_csv --background, image uploads)
+        return False
+
+    @admin.display(description="Progress")
+    def progress(self, obj):
+        if obj.progress_percent is None:
+            return "-"
+        return f"{obj.progress_done}/{obj.progress_total} ({obj.progress_percent}%)"
+
+    @admin.action(description="Cancel selected jobs")
+    def cancel_jobs(self, request, queryset):
+        # queued jobs stop right away; running ones stop at their next progress checkpoint
+        queued = queryset.filter(status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_CANCELLED, cancel_requested=True, finished_at=timezone.now()
+        )
+        running = queryset.filter(status=Job.STATUS_RUNNING).update(cancel_requested=True)
+        self.message_user(request, f"Cancelled {queued} queued job(s), requested cancellation of {running} running job(s).")
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        count = queryset.filter(status__in=[Job.STATUS_FAILED, Job.STATUS_CANCELLED]).update(
+            status=Job.STATUS_QUEUED,
+            attempts=0,
+            cancel_requested=False,
+            run_after=timezone.now(),
+            error="",
+            message="",
+            finished_at=None,
+        )
+        self.message_user(request, f"Queued {count} job(s) again.")
@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+VERSION_KEY = "listings:results:version"
+
+
+def get_counter(cache, key: str) -> int:
+    # starts from the clock rather than 1: if the backend evicts the counter, it must not come back
+    # as a value that was already used, or entries cached under that old value would be served again
+    return cache.get_or_set(key, time.time_ns() // 1000, timeout=None)
+
+
+def bump_counter(cache, key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_counter(cache, key)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCoalescer:
+    """
+    Response cache for the hot read endpoints with single-flight computation:
+    when a key is missing, one caller computes it and everyone else asking for the same key waits for that result
+    instead of running the identical query. Threads of one process share an in-memory call table;
+    other processes see a lock key in the shared cache and poll for the result.
+    With stale_ttl > 0 an expired entry is still served for that many seconds while one caller refreshes it in the background.
+    """
+
+    def __init__(self, cache_alias: str, ttl: int, stale_ttl: int, lock_timeout: int):
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+
+        self._calls = {} # key -> _Call, computations in flight in this process
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "computed": 0, "collapsed": 0, "stale_served": 0, "errors": 0}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    # keys and invalidation
+
+    def version(self) -> int:
+        return get_counter(self.cache, VERSION_KEY)
+
+    def bump_version(self):
+        """Every cached result becomes unreachable; called whenever listings data changes."""
+        bump_counter(self.cache, VERSION_KEY)
+
+    def make_key(self, name: str, request) -> str:
+        # absolute url, because serializers embed absolute image/pagination urls built from the request host
+        params = sorted(request.query_params.lists())
+        raw = f"{request.build_absolute_uri(request.path)}?{params}"
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"listings:results:{self.version()}:{name}:{digest}"
+
+    # metrics
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+        data["in_flight"] = len(self._calls)
+        return data
+
+    # lookup
+
+    def get_or_compute(self, key: str, compute):
+        entry = self.cache.get(key) # (value, fresh_until)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until > time.time():
+                self._count("hits")
+                return value
+
+            if self.stale_ttl:
+                self._count("stale_served")
+                self._refresh_in_background(key, compute)
+                return value
+
+        return self._single_flight(key, compute)
+
+    def _single_flight(self, key: str, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count("collapsed")
+            if call.done.wait(self.lock_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # the leader is stuck; don't make this request wait forever
+            return compute()
+
+        try:
+            call.result = self._compute_across_processes(key, compute)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            self._count("errors")
+            raise
+        finally:
+            call.done.set()
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _compute_across_processes(self, key: str, compute):
+        lock_key = f"{key}:lock"
+        holds_lock = self.cache.add(lock_key, 1, timeout=self.lock_timeout)
+
+        if not holds_lock:
+            # another process is computing this key, wait for it to publish the result
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = self.cache.get(key)
+                if entry is not None and entry[1] > time.time():
+                    self._count("collapsed")
+                    return entry[0]
+                if self.cache.get(lock_key) is None:
+                    break
+
+        try:
+            value = compute()
+            self._count("computed")
+            self.cache.set(key, (value, time.time() + self.ttl), timeout=self.ttl + self.stale_ttl)
+            return value
+        finally:
+            if holds_lock:
+                self.cache.delete(lock_key)
+
+    def _refresh_in_background(self, key: str, compute):
+        with self._lock:
+            if key in self._calls:
+                return # a refresh is already running
+
+        def run():
+            try:
+                self._single_flight(key, compute)
+            except Exception:
+                pass # counted in stats; the stale value keeps being served until the entry expires
+            finally:
+                connections.close_all() # the thread opened its own db connection
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+coalescer = ResultCoalescer(
+    cache_alias=getattr(settings, "SEARCH_CACHE_ALIAS", "default"),
+    ttl=getattr(settings, "SEARCH_CACHE_TTL", 60),
+    stale_ttl=getattr(settings, "SEARCH_CACHE_STALE_TTL", 0),
+    lock_timeout=getattr(settings, "SEARCH_CACHE_LOCK_TIMEOUT", 10),
+)
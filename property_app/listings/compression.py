@@ -0,0 +1,136 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd  # python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd  # optional
+    except ImportError:
+        zstd = None
+
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=5)
+
+
+def _zstd(body: bytes) -> bytes:
+    return zstd.compress(body, 3)
+
+
+# in order of preference when the client accepts several with the same q value
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+if zstd is not None:
+    ENCODERS["zstd"] = _zstd
+ENCODERS["gzip"] = _gzip
+
+# html pages are left alone: they can carry csrf tokens, and compressing secrets next to reflected input enables BREACH
+COMPRESSIBLE_TYPES_RE = re.compile(r"^(text/(css|plain|javascript)|application/(json|javascript|xml)|image/svg\+xml)")
+
+
+def choose_encoding(accept_encoding: str):
+    """
+    Picks the best available encoding from an Accept-Encoding header, honouring q values (q=0 means "not acceptable").
+    Returns None when nothing acceptable is available.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses text/json responses above COMPRESSION_MIN_SIZE with brotli, zstd or gzip, whichever the client prefers
+    and is installed. Responses built from the result cache (views set `response.cache_key`) also get their
+    compressed bytes cached under the same key, so a hot page is compressed once and not on every hit.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 512)
+        self.cache_alias = getattr(settings, "SEARCH_CACHE_ALIAS", "default")
+        self.cache_timeout = getattr(settings, "SEARCH_CACHE_TTL", 60) + getattr(settings, "SEARCH_CACHE_STALE_TTL", 0)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (
+            response.streaming
+            or response.status_code != 200
+            or response.has_header("Content-Encoding")
+            or not COMPRESSIBLE_TYPES_RE.match(response.get("Content-Type", ""))
+        ):
+            return response
+
+        # whatever the outcome, the body depends on the request's Accept-Encoding
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        if len(response.content) < self.min_size:
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        compressed = self._compress(response, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+
+        # the compressed body is a different representation, so a strong etag has to become weak
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+    def _compress(self, response, encoding: str) -> bytes:
+        cache_key = getattr(response, "cache_key", None)
+        if not cache_key:
+            return ENCODERS[encoding](response.content)
+
+        # the renderer is part of what got compressed (the same url can render json or the browsable api)
+        media_type = response.get("Content-Type", "").split(";")[0].strip()
+        key = f"{cache_key}:{media_type}:{encoding}"
+        cache = caches[self.cache_alias]
+
+        compressed = cache.get(key)
+        if compressed is None:
+            compressed = ENCODERS[encoding](response.content)
+            cache.set(key, compressed, timeout=self.cache_timeout)
+        return compressed
@@ -0,0 +1,235 @@
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.core.files import File
+
+from .models import Location, Property, PropertyImage
+
+LOCATION_HEADERS = {"name"}
+PROPERTY_HEADERS = {"external_id", "location_name", "property_name", "country", "address", "title", "description"}
+IMAGE_HEADERS = {"property_external_id", "file_path", "is_primary", "alt_text"}
+
+
+class IngestError(Exception):
+    """A problem with the import data (bad row, missing file...), reported with its file and line."""
+
+
+def parse_bool(value: str) -> bool:
+    """
+    Accepts: true/false, 1/0, yes/no (case-insensitive).
+    """
+    v = (value or "").strip().lower()
+    if v in {"true", "1", "yes", "y"}:
+        return True
+    if v in {"false", "0", "no", "n", ""}:
+        return False
+    raise ValueError(f"Invalid boolean value: '{value}' (use true/false)")
+
+
+def read_csv(path: Path) -> List[dict]:
+    if not path.exists():
+        raise IngestError(f"CSV not found: {path}")
+    with path.open("r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames:
+            raise IngestError(f"CSV has no header: {path}")
+        return list(reader)
+
+
+def require_headers(path: Path, rows: List[dict], required: set):
+    if not rows:
+        raise IngestError(f"CSV is empty (no rows): {path}")
+    headers = set(rows[0].keys())
+    missing = required - headers
+    if missing:
+        raise IngestError(f"CSV missing columns {sorted(missing)}: {path}")
+
+
+@dataclass
+class SeedPaths:
+    base_dir: Path
+    locations_csv: Path
+    properties_csv: Path
+    images_csv: Path
+
+    @classmethod
+    def from_options(cls, base: str, locations: str, properties: str, images: str) -> "SeedPaths":
+        base_dir = Path(base).resolve()
+        return cls(
+            base_dir=base_dir,
+            locations_csv=base_dir / locations,
+            properties_csv=base_dir / properties,
+            images_csv=base_dir / images,
+        )
+
+
+@dataclass
+class SeedRows:
+    locations: List[dict]
+    properties: List[dict]
+    images: List[dict]
+
+    @classmethod
+    def load(cls, paths: SeedPaths) -> "SeedRows":
+        # Read CSVs first (fail early with good errors)
+        rows = cls(
+            locations=read_csv(paths.locations_csv),
+            properties=read_csv(paths.properties_csv),
+            images=read_csv(paths.images_csv),
+        )
+
+        # Basic header validation (prevents silent wrong imports)
+        require_headers(paths.locations_csv, rows.locations, LOCATION_HEADERS)
+        require_headers(paths.properties_csv, rows.properties, PROPERTY_HEADERS)
+        require_headers(paths.images_csv, rows.images, IMAGE_HEADERS)
+        return rows
+
+    @property
+    def total(self) -> int:
+        return len(self.locations) + len(self.properties) + len(self.images)
+
+
+class CsvSeeder:
+    """
+    Row level import logic shared by `seed_from_csv` (one transaction) and the background worker
+    (small committed batches). Every step is idempotent, so a batch can be re-run after a failure.
+    Rows are passed with `first_line`, the csv line number of the first row, so errors point at the right line.
+    Relative image file paths are resolved against `root` (default: the current directory).
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root) if root else Path.cwd()
+        self.locations: Dict[str, Location] = {}
+        self.properties: Dict[str, Property] = {}
+        self.images_created = 0
+
+    def clear_existing(self):
+        # Order matters due to FK constraints
+        PropertyImage.objects.all().delete()
+        Property.objects.all().delete()
+        Location.objects.all().delete()
+
+    def seed_locations(self, rows: List[dict], first_line: int = 2):  # line 1 is the header
+        """
+        Fills the map: location_name -> Location object
+        """
+        for i, r in enumerate(rows, start=first_line):
+            name = (r.get("name") or "").strip()
+            if not name:
+                raise IngestError(f"locations.csv line {i}: 'name' is required")
+
+            # get_or_create avoids duplicates if you seed multiple times without --clear
+            loc, _ = Location.objects.get_or_create(name=name)
+            self.locations[name.lower()] = loc  # store normalized for easy lookup
+
+    def seed_properties(self, rows: List[dict], first_line: int = 2):
+        """
+        Fills the map: external_id -> Property object
+        """
+        for i, r in enumerate(rows, start=first_line):
+            external_id = (r.get("external_id") or "").strip()
+            location_name = (r.get("location_name") or "").strip()
+            if not external_id:
+                raise IngestError(f"properties.csv line {i}: 'external_id' is required")
+            if not location_name:
+                raise IngestError(f"properties.csv line {i}: 'location_name' is required")
+
+            loc = self.locations.get(location_name.lower())
+            if not loc:
+                raise IngestError(
+                    f"properties.csv line {i}: unknown location_name='{location_name}'. "
+                    f"Add it to locations.csv."
+                )
+
+            # Create or update by external_id (stable key)
+            obj, _ = Property.objects.update_or_create(
+                external_id=external_id,
+                defaults={
+                    "location": loc,
+                    "property_name": (r.get("property_name") or "").strip(),
+                    "country": (r.get("country") or "").strip(),
+                    "address": (r.get("address") or "").strip(),
+                    "title": (r.get("title") or "").strip(),
+                    "description": (r.get("description") or "").strip(),
+                },
+            )
+
+            self.properties[external_id] = obj
+
+    def check_primary_images(self, rows: List[dict], first_line: int = 2):
+        """
+        Enforces: only one primary image per property.
+        Checked over the whole file up front, so a batched import can't stop half way because of it.
+        """
+        # Track primary per property (fail fast if CSV is wrong)
+        primary_seen: Dict[str, int] = {}
+
+        for i, r in enumerate(rows, start=first_line):
+            prop_ext = (r.get("property_external_id") or "").strip()
+            try:
+                is_primary = parse_bool(r.get("is_primary", "false"))
+            except ValueError as e:
+                raise IngestError(f"images.csv line {i}: {e}")
+
+            if is_primary:
+                primary_seen[prop_ext] = primary_seen.get(prop_ext, 0) + 1
+                if primary_seen[prop_ext] > 1:
+                    raise IngestError(
+                        f"images.csv invalid: property '{prop_ext}' has more than one primary image."
+                    )
+
+    def seed_images(self, rows: List[dict], first_line: int = 2):
+        """
+        Copies files into MEDIA_ROOT through ImageField saving.
+        """
+        for i, r in enumerate(rows, start=first_line):
+            prop_ext = (r.get("property_external_id") or "").strip()
+            file_path = (r.get("file_path") or "").strip()
+            alt_text = (r.get("alt_text") or "").strip()
+
+            if not prop_ext:
+                raise IngestError(f"images.csv line {i}: 'property_external_id' is required")
+            if not file_path:
+                raise IngestError(f"images.csv line {i}: 'file_path' is required")
+
+            prop = self.properties.get(prop_ext)
+            if not prop:
+                raise IngestError(
+                    f"images.csv line {i}: unknown property_external_id='{prop_ext}'. "
+                    f"Add it to properties.csv."
+                )
+
+            try:
+                is_primary = parse_bool(r.get("is_primary", "false"))
+            except ValueError as e:
+                raise IngestError(f"images.csv line {i}: {e}")
+
+            src = (self.root / file_path).resolve() # an absolute file_path replaces root
+            if not src.exists():
+                raise IngestError(
+                    f"images.csv line {i}: file not found: '{file_path}' (resolved to {src})"
+                )
+            if src.is_dir():
+                raise IngestError(f"images.csv line {i}: file_path points to a directory: {src}")
+
+            # If the same CSV is imported twice, avoid duplicating identical entries:
+            # (simple approach: check by filename + property)
+            existing = PropertyImage.objects.filter(property=prop, alt_text=alt_text, is_primary=is_primary)
+            # NOTE: this is intentionally simple; you can tighten later.
+            if existing.exists():
+                # rows imported before placeholders existed get them on the next seed run
+                for img in existing.filter(placeholder=""):
+                    img.refresh_placeholder()
+                continue
+
+            img_obj = PropertyImage(property=prop, is_primary=is_primary, alt_text=alt_text)
+            img_obj.process_inline = True  # already off the request path, no need to queue a job
+
+            # Save file into the ImageField; Django will copy it into MEDIA_ROOT using upload_to()
+            # PropertyImage.save() then computes the placeholder / dominant colour / size from the stored file
+            with src.open("rb") as f:
+                img_obj.image.save(src.name, File(f), save=True)
+
+            self.images_created += 1
@@ -0,0 +1,165 @@
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .ingest import CsvSeeder, IngestError, SeedPaths, SeedRows
+from .models import Job, PropertyImage
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """
+    Handed to job handlers: reports progress (which also serves as heartbeat)
+    and raises JobCancelled at the next checkpoint once cancellation was requested from the admin.
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def progress(self, done: int, total: Optional[int] = None, message: str = ""):
+        now = timezone.now()
+        fields = {"progress_done": done, "heartbeat_at": now}
+        if total is not None:
+            fields["progress_total"] = total
+        if message:
+            fields["message"] = message[:255]
+
+        Job.objects.filter(pk=self.job.pk).update(**fields)
+        for field, value in fields.items():
+            setattr(self.job, field, value)
+
+        if Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def _batches(rows: List[dict], size: int):
+    for start in range(0, len(rows), size):
+        # +2: csv line numbers start at 1 and line 1 is the header
+        yield rows[start:start + size], start + 2
+
+
+def run_seed_csv(ctx: JobContext, payload: dict):
+    """
+    Same import as `seed_from_csv`, but every batch of rows commits on its own, so the sqlite write lock
+    is only held for one batch at a time and live requests get in between. Re-running is safe: every step is idempotent.
+    """
+    if payload.get("clear"):
+        # refused by seed_from_csv too: clearing first would leave the live catalogue empty while batches run
+        raise IngestError("Background imports can't clear existing data. Run seed_from_csv --clear without --background.")
+
+    batch_size = payload.get("batch_size") or getattr(settings, "JOB_BATCH_SIZE", 50)
+    paths = SeedPaths.from_options(payload["base"], payload["locations"], payload["properties"], payload["images"])
+    rows = SeedRows.load(paths)
+
+    seeder = CsvSeeder(root=payload.get("root"))
+    seeder.check_primary_images(rows.images)
+
+    done = 0
+    ctx.progress(done, rows.total, "Starting import")
+
+    steps = [
+        ("locations", rows.locations, seeder.seed_locations),
+        ("properties", rows.properties, seeder.seed_properties),
+        ("images", rows.images, seeder.seed_images),
+    ]
+    for name, step_rows, seed in steps:
+        for batch, first_line in _batches(step_rows, batch_size):
+            with transaction.atomic():
+                seed(batch, first_line)
+            done += len(batch)
+            ctx.progress(done, message=f"Importing {name}: line {first_line + len(batch) - 1}")
+
+    ctx.progress(done, message=(
+        f"Imported {len(seeder.locations)} locations, {len(seeder.properties)} properties, "
+        f"{seeder.images_created} new images"
+    ))
+
+
+def run_image_placeholder(ctx: JobContext, payload: dict):
+    image = PropertyImage.objects.filter(pk=payload["image_id"]).first()
+    if image is None or image.placeholder:
+        return # deleted meanwhile, or already processed
+    ctx.progress(0, 1, f"Processing image {image.pk}")
+    image.refresh_placeholder()
+    ctx.progress(1)
+
+
+HANDLERS: Dict[str, Callable[[JobContext, dict], None]] = {
+    Job.KIND_SEED_CSV: run_seed_csv,
+    Job.KIND_IMAGE_PLACEHOLDER: run_image_placeholder,
+}
+
+
+def claim_next_job(worker: str) -> Optional[Job]:
+    """
+    Claims the oldest due job. The conditional UPDATE is the lock: if another worker claimed
+    the same row first, it matches 0 rows and we try the next one (sqlite has no SELECT ... FOR UPDATE).
+    Running jobs whose heartbeat stopped (crashed worker) are claimed again, unless that was their last attempt:
+    a job that keeps killing the worker must not be retried forever, so those are marked failed instead.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=getattr(settings, "JOB_STALE_AFTER", 300))
+    stale = Q(status=Job.STATUS_RUNNING, heartbeat_at__lt=stale_before)
+
+    Job.objects.filter(stale, attempts__gte=F("max_attempts")).update(
+        status=Job.STATUS_FAILED,
+        finished_at=now,
+        message="Worker stopped responding during the last attempt",
+    )
+
+    due = Q(status=Job.STATUS_QUEUED, run_after__lte=now) | (stale & Q(attempts__lt=F("max_attempts")))
+    candidates = Job.objects.filter(due).order_by("run_after", "id").values_list("id", "status")[:10]
+
+    for pk, status in candidates:
+        claimed = Job.objects.filter(pk=pk, status=status).filter(due).update(
+            status=Job.STATUS_RUNNING,
+            worker=worker,
+            heartbeat_at=now,
+            started_at=now,
+            finished_at=None,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job: Job):
+    handler = HANDLERS.get(job.kind)
+    Job.objects.filter(pk=job.pk).update(attempts=job.attempts + 1, error="")
+    job.attempts += 1
+
+    try:
+        if handler is None:
+            raise IngestError(f"Unknown job kind '{job.kind}'")
+        if job.cancel_requested:
+            raise JobCancelled()
+        handler(JobContext(job), job.payload)
+    except JobCancelled:
+        _finish(job, Job.STATUS_CANCELLED, message="Cancelled")
+    except Exception as e:
+        error = "".join(traceback.format_exception(e))
+        if job.attempts < job.max_attempts and not isinstance(e, IngestError):
+            # bad data won't fix itself; anything else (locked database, io error...) is retried with a backoff
+            delay = getattr(settings, "JOB_RETRY_DELAY", 30) * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_QUEUED,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                error=error,
+                message=f"Attempt {job.attempts} failed, retrying in {delay}s",
+            )
+        else:
+            _finish(job, Job.STATUS_FAILED, message=str(e)[:255], error=error)
+    else:
+        _finish(job, Job.STATUS_SUCCEEDED)
+
+
+def _finish(job: Job, status: str, **fields):
+    Job.objects.filter(pk=job.pk).update(status=status, finished_at=timezone.now(), **fields)
@@ -0,0 +1,40 @@
+import hashlib
+import json
+from typing import Tuple
+
+from django.conf import settings
+
+from .coalescing import coalescer
+from .models import Location
+
+INDEX_FIELDS = ["name", "slug"]
+
+
+def build_location_index() -> dict:
+    """
+    Every location as compact [name, slug] pairs, for client side autocomplete.
+    The version is a hash of the content, so it only changes when a location does.
+    When there are more locations than LOCATION_INDEX_MAX_ENTRIES the list is left out
+    ("complete": false) and clients keep using /api/locations/autocomplete/.
+    """
+    max_entries = getattr(settings, "LOCATION_INDEX_MAX_ENTRIES", 5000)
+
+    rows = list(Location.objects.order_by("name").values_list(*INDEX_FIELDS)[:max_entries + 1])
+    complete = len(rows) <= max_entries
+    results = [list(row) for row in rows] if complete else []
+
+    body = json.dumps(results, separators=(",", ":"), ensure_ascii=False)
+    version = hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+    return {
+        "version": version,
+        "complete": complete,
+        "fields": INDEX_FIELDS,
+        "results": results,
+    }
+
+
+def cached_location_index() -> Tuple[str, dict]:
+    """(cache key, index) through the result cache, shared by the endpoint and the home page that links to it."""
+    key = f"listings:results:{coalescer.version()}:locations:index"
+    return key, coalescer.get_or_compute(key, build_location_index)
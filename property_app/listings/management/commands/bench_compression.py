@@ -0,0 +1,84 @@
+import time
+from typing import List
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from listings.coalescing import coalescer
+from listings.compression import ENCODERS
+from listings.models import Location, Property
+
+
+class Command(BaseCommand):
+    help = "Measure bytes on the wire and CPU time per request for API responses, per content encoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Requests per url and encoding (default: 50).",
+        )
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="Url to measure, can be repeated (default: a search page, a property detail and the location index).",
+        )
+
+    def handle(self, *args, **options):
+        n = options["requests"]
+        if n < 1:
+            raise CommandError("--requests must be at least 1")
+
+        urls = options["urls"] or self._default_urls()
+        encodings = ["identity", *ENCODERS]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compression benchmark ({n} requests each)"))
+        self.stdout.write(f"{'url':<45} {'encoding':<9} {'bytes':>8} {'cold cpu ms':>12} {'warm cpu ms':>12}")
+
+        # ALLOWED_HOSTS is empty outside DEBUG; the test client talks to "testserver".
+        # Throttling is off, the benchmark deliberately sends requests back to back.
+        with override_settings(ALLOWED_HOSTS=["testserver"], THROTTLE_CLIENT_BUDGETS={}, THROTTLE_GLOBAL_BUDGETS={}):
+            client = Client()
+            for url in urls:
+                for encoding in encodings:
+                    size, cold, warm = self._measure(client, url, encoding, n)
+                    self.stdout.write(f"{url[:45]:<45} {encoding:<9} {size:>8} {cold:>12.3f} {warm:>12.3f}")
+
+    def _default_urls(self) -> List[str]:
+        urls = []
+        location = Location.objects.filter(properties__isnull=False).first()
+        if location:
+            urls.append(f"/api/properties/?{urlencode({'location': location.name})}")
+        prop = Property.objects.first()
+        if prop:
+            urls.append(f"/api/properties/{prop.id}/")
+        urls.append("/api/locations/index/")
+        return urls
+
+    def _measure(self, client, url: str, encoding: str, n: int):
+        """
+        cold: cached results and compressed bodies invalidated before every request (full render + compression).
+        warm: served from the caches, which is what hot pages see.
+        """
+        size = 0
+        cold_total = 0.0
+        for _ in range(n):
+            # only the listings results (and their compressed bodies, keyed by them) become unreachable;
+            # clearing the cache would also drop throttle buckets and anything else stored in it
+            coalescer.bump_version()
+            start = time.process_time()
+            response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            cold_total += time.process_time() - start
+            size = len(response.content)
+
+        warm_total = 0.0
+        for _ in range(n):
+            start = time.process_time()
+            client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            warm_total += time.process_time() - start
+
+        return size, cold_total / n * 1000, warm_total / n * 1000
@@ -0,0 +1,132 @@
+from typing import Dict, List, Set
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min
+
+from listings.models import Property, SimilarProperty
+from listings.similarity import build_vectors, top_k_neighbours
+
+FEATURE_FIELDS = ("id", "title", "description", "property_name", "location__name", "country", "updated_at")
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the top-K most similar properties for every property (hashed TF-IDF + cosine, NumPy). "
+        "By default only properties changed since their neighbours were computed, and lists they affect, are refreshed. "
+        "That is an approximation: IDF weights shift as properties change, which moves every score a little, so run "
+        "with --full periodically (e.g. nightly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--k",
+            type=int,
+            default=6,
+            help="Neighbours kept per property (default: 6).",
+        )
+        parser.add_argument(
+            "--dim",
+            type=int,
+            default=4096,
+            help="Hashed feature dimensions (default: 4096).",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every property's neighbours (also picks up IDF drift the incremental run ignores).",
+        )
+
+    def handle(self, *args, **options):
+        k = options["k"]
+        dim = options["dim"]
+        if k < 1 or dim < 16:
+            raise CommandError("--k must be >= 1 and --dim >= 16")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Building similar properties..."))
+
+        rows = list(Property.objects.order_by("id").values(*FEATURE_FIELDS))
+        if not rows:
+            self.stdout.write(self.style.WARNING("No properties, nothing to do."))
+            return
+
+        ids = [r["id"] for r in rows]
+        index_of = {pk: i for i, pk in enumerate(ids)}
+
+        vectors = build_vectors(rows, dim)
+        self.stdout.write(f"- Vectors: {vectors.shape[0]} x {vectors.shape[1]}")
+
+        if options["full"]:
+            targets = set(range(len(ids)))
+        else:
+            changed = self._changed_indexes(rows, index_of, k)
+            targets = changed | self._affected_indexes(vectors, changed, index_of, k)
+            self.stdout.write(f"- Changed: {len(changed)}, lists to refresh: {len(targets)}")
+
+        neighbours = top_k_neighbours(vectors, sorted(targets), k)
+
+        links = [
+            SimilarProperty(property_id=ids[row], similar_id=ids[other], rank=rank, score=score)
+            for row, pairs in neighbours.items()
+            for rank, (other, score) in enumerate(pairs, start=1)
+        ]
+
+        # short write transaction: everything above ran without holding the sqlite write lock
+        with transaction.atomic():
+            SimilarProperty.objects.filter(property_id__in=[ids[row] for row in targets]).delete()
+            SimilarProperty.objects.bulk_create(links, batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Refreshed neighbours of {len(targets)} properties ({len(links)} rows)."))
+
+    def _changed_indexes(self, rows: List[dict], index_of: Dict[int, int], k: int) -> Set[int]:
+        """
+        Properties edited after their neighbour list was computed, and those with a short list
+        (new properties, or a neighbour got deleted).
+        """
+        expected = min(k, len(rows) - 1)
+        computed = {
+            r["property_id"]: r
+            for r in SimilarProperty.objects.values("property_id").annotate(n=Count("id"), at=Min("computed_at"))
+        }
+
+        changed = set()
+        for row in rows:
+            info = computed.get(row["id"])
+            if info is None or info["n"] < expected or row["updated_at"] > info["at"]:
+                changed.add(index_of[row["id"]])
+        return changed
+
+    def _affected_indexes(self, vectors: np.ndarray, changed: Set[int], index_of: Dict[int, int], k: int) -> Set[int]:
+        """
+        Unchanged properties whose list may now be wrong: a changed property is already in it (its score moved)
+        or now scores above the weakest neighbour kept.
+        Approximate: new scores use this run's IDF weights while the stored ones used the weights of the run that
+        wrote them, so lists that only drift through IDF changes are left alone until the next --full run.
+        """
+        if not changed:
+            return set()
+
+        changed_ids = {pk for pk, i in index_of.items() if i in changed}
+        lists: Dict[int, Dict[int, float]] = {}
+        for link in SimilarProperty.objects.values("property_id", "similar_id", "score"):
+            lists.setdefault(link["property_id"], {})[link["similar_id"]] = link["score"]
+
+        unchanged = [i for i in range(vectors.shape[0]) if i not in changed]
+        if not unchanged:
+            return set()
+
+        changed_list = sorted(changed)
+        scores = vectors[unchanged] @ vectors[changed_list].T # (unchanged, changed)
+        ids = {i: pk for pk, i in index_of.items()}
+
+        affected = set()
+        for row_pos, row in enumerate(unchanged):
+            current = lists.get(ids[row], {})
+            if changed_ids & current.keys():
+                affected.add(row)
+                continue
+            weakest = min(current.values()) if len(current) >= k else -np.inf
+            if scores[row_pos].max() > weakest:
+                affected.add(row)
+        return affected
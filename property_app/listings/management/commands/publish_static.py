@@ -0,0 +1,280 @@
+import gzip
+import hashlib
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Set
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+
+from listings.location_index import build_location_index
+from listings.models import Location, Property
+from listings.serializers import PropertyDetailSerializer, PropertyListSerializer
+
+try:
+    import brotli  # optional: only used to write .br siblings
+except ImportError:
+    brotli = None
+
+
+MANIFEST_NAME = "manifest.json"
+VERSION_NAME = "version.json"
+CURRENT_NAME = "current" # symlink to the live version directory
+VERSIONS_DIR = "versions"
+
+
+def _page_size() -> int:
+    return settings.REST_FRAMEWORK.get("PAGE_SIZE") or 8
+
+
+def _search_page_url(page: int) -> str:
+    # relative to the page it's in: a client that started paging in one version stays in it
+    return f"page-{page}.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render location search pages, property detail payloads and the location index to static JSON files "
+        "(with .gz/.br siblings) so the front web server can answer reads without Django. "
+        "Every publish goes to a new version directory and the 'current' symlink is switched to it at the end. "
+        "Only rows changed since the last publish are re-rendered unless --full is given; "
+        "run with --full after changing what the serializers output (e.g. new fields), since that changes no rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--out",
+            default=str(getattr(settings, "STATIC_PUBLISH_ROOT", Path(settings.BASE_DIR) / "publish")),
+            help="Publish directory (default: STATIC_PUBLISH_ROOT).",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Re-render everything instead of only the rows changed since the last publish.",
+        )
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=3,
+            help="Version directories to keep, so clients paging through an older version can finish (default: 3).",
+        )
+
+    def handle(self, *args, **options):
+        if options["keep"] < 1:
+            raise CommandError("--keep must be at least 1")
+
+        self.root = Path(options["out"]).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        current = self.root / CURRENT_NAME
+        self.previous_dir = current.resolve() if current.exists() else None
+        manifest = self._load_manifest()
+        # every search page is cut by page size, a different one invalidates all of them (not only the dirty locations)
+        full = options["full"] or not manifest.get("published_at") or manifest.get("page_size") != _page_size()
+        since = None if full else parse_datetime(manifest["published_at"])
+        version = manifest.get("version", 0) + 1
+
+        # readers only ever see complete versions: everything is written into a new directory,
+        # which goes live when the symlink is switched at the very end
+        self.out = self.root / VERSIONS_DIR / str(version)
+        if self.out.exists():
+            shutil.rmtree(self.out) # left over by a run that failed before switching
+        self.out.mkdir(parents=True)
+
+        # taken before reading, so rows edited while publishing are picked up by the next run
+        started_at = timezone.now()
+
+        # rel path -> sha256 of the json body; unchanged payloads are hard linked from the previous version
+        self.previous: Dict[str, str] = manifest.get("files", {})
+        self.files: Dict[str, str] = {} if full else dict(self.previous)
+        self.rendered: Set[str] = set()
+        self.written = 0
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Publishing static payloads..."))
+        self.stdout.write(f"- Out: {self.out}")
+        self.stdout.write(f"- Mode: {'full' if full else f'incremental since {since.isoformat()}'}")
+
+        old_properties: Dict[str, str] = {} if full else manifest.get("properties", {}) # id -> location slug
+        old_locations: Set[str] = set() if full else set(manifest.get("locations", []))
+
+        current_properties = {str(pk): slug for pk, slug in Property.objects.values_list("id", "location__slug")}
+        current_locations = set(Location.objects.values_list("slug", flat=True))
+
+        # which rows need re-rendering
+        if full:
+            changed_ids = set(current_properties)
+            dirty_locations = set(current_locations)
+        else:
+            changed_locations = set(Location.objects.filter(updated_at__gt=since).values_list("slug", flat=True))
+            changed_ids = {
+                str(pk) for pk in Property.objects.filter(updated_at__gt=since).values_list("id", flat=True)
+            }
+            # a renamed location shows up inside every property detail payload of that location
+            changed_ids |= {pk for pk, slug in current_properties.items() if slug in changed_locations}
+
+            deleted_ids = set(old_properties) - set(current_properties)
+            dirty_locations = set(changed_locations)
+            dirty_locations |= {current_properties[pk] for pk in changed_ids}
+            dirty_locations |= {old_properties[pk] for pk in changed_ids | deleted_ids if pk in old_properties}
+            dirty_locations &= current_locations
+
+            for pk in deleted_ids:
+                self._forget_prefix(f"api/properties/{pk}/")
+
+        for slug in old_locations - current_locations:
+            self._forget_prefix(f"search/{slug}/")
+
+        self._publish_details(changed_ids)
+        self._publish_locations(dirty_locations)
+
+        if full or dirty_locations or old_locations != current_locations:
+            self._publish_location_index()
+
+        self._carry_over()
+        removed = len(set(self.previous) - set(self.files))
+
+        manifest = {
+            "version": version,
+            "published_at": started_at.isoformat(),
+            "page_size": _page_size(),
+            "properties": current_properties,
+            "locations": sorted(current_locations),
+            "files": dict(sorted(self.files.items())),
+        }
+        self._write(self.out / MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"))
+        # what clients read (through the symlink) to pin the version they page through
+        self._write(self.out / VERSION_NAME, json.dumps({"version": version}).encode("utf-8"))
+
+        self._switch_current(version)
+        pruned = self._prune_versions(options["keep"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Published version {version}: {len(changed_ids)} properties, "
+                f"{len(dirty_locations)} locations re-rendered, {self.written} files written, {removed} removed, "
+                f"{pruned} old versions pruned."
+            )
+        )
+
+    # rendering
+
+    def _publish_details(self, ids: Set[str]):
+        qs = Property.objects.select_related("location").prefetch_related("images").filter(id__in=ids)
+        for prop in qs.iterator(chunk_size=200):
+            data = PropertyDetailSerializer(prop).data
+            self._publish(f"api/properties/{prop.id}/index.json", data)
+
+    def _publish_locations(self, slugs: Set[str]):
+        page_size = _page_size()
+
+        for location in Location.objects.filter(slug__in=slugs):
+            props = list(
+                Property.objects.filter(location=location)
+                .select_related("location")
+                .prefetch_related("images")
+            )
+            count = len(props)
+            pages = max(1, math.ceil(count / page_size))
+
+            # the page count can shrink; pages not published again are not carried over
+            self._forget_prefix(f"search/{location.slug}/")
+
+            for page in range(1, pages + 1):
+                chunk = props[(page - 1) * page_size: page * page_size]
+                data = {
+                    "count": count,
+                    "next": _search_page_url(page + 1) if page < pages else None,
+                    "previous": _search_page_url(page - 1) if page > 1 else None,
+                    "results": PropertyListSerializer(chunk, many=True).data,
+                }
+                self._publish(f"search/{location.slug}/page-{page}.json", data)
+
+    def _publish_location_index(self):
+        # same payload as /api/locations/index/
+        self._publish("api/locations/index/index.json", build_location_index())
+
+    # files
+
+    def _publish(self, rel_path: str, data):
+        body = JSONRenderer().render(data)
+        digest = hashlib.sha256(body).hexdigest()
+
+        self.files[rel_path] = digest
+        if self.previous.get(rel_path) == digest and self._previous_file(rel_path):
+            return # unchanged payload: carried over as it is (same inode, so same mtime / etag)
+
+        target = self.out / rel_path
+        self._write(target, body)
+        # mtime=0 keeps the gzip output byte-identical for identical payloads
+        self._write(target.with_name(target.name + ".gz"), gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self._write(target.with_name(target.name + ".br"), brotli.compress(body))
+
+        self.rendered.add(rel_path)
+        self.written += 1
+
+    def _write(self, path: Path, body: bytes):
+        # no temp file + rename needed: nobody reads a version directory before it's switched live
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+
+    def _previous_file(self, rel_path: str):
+        if self.previous_dir is None:
+            return None
+        path = self.previous_dir / rel_path
+        return path if path.exists() else None
+
+    def _carry_over(self):
+        """Hard links every file of the previous version that wasn't re-rendered (copies if links aren't supported)."""
+        for rel_path in set(self.files) - self.rendered:
+            source = self._previous_file(rel_path)
+            if source is None:
+                raise CommandError(f"{rel_path} is missing from the previous version. Run with --full.")
+
+            for suffix in ("", ".gz", ".br"):
+                src = source.with_name(source.name + suffix)
+                if not src.exists():
+                    continue
+                dst = self.out / (rel_path + suffix)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)
+
+    def _forget_prefix(self, prefix: str):
+        for rel_path in [p for p in self.files if p.startswith(prefix)]:
+            del self.files[rel_path]
+
+    def _switch_current(self, version: int):
+        # a symlink can't be overwritten in place, but it can be renamed over: readers see the old or the new version
+        tmp = self.root / f".{CURRENT_NAME}.tmp"
+        tmp.unlink(missing_ok=True)
+        os.symlink(Path(VERSIONS_DIR) / str(version), tmp, target_is_directory=True)
+        os.replace(tmp, self.root / CURRENT_NAME)
+
+    def _prune_versions(self, keep: int) -> int:
+        versions = sorted(
+            (int(path.name) for path in (self.root / VERSIONS_DIR).iterdir() if path.name.isdigit()),
+            reverse=True,
+        )
+        for version in versions[keep:]:
+            shutil.rmtree(self.root / VERSIONS_DIR / str(version))
+        return len(versions[keep:])
+
+    def _load_manifest(self) -> dict:
+        if self.previous_dir is None:
+            return {}
+        path = self.previous_dir / MANIFEST_NAME
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError as e:
+            raise CommandError(f"Unreadable manifest {path}: {e}. Run with --full to republish from scratch.")
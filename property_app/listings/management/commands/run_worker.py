@@ -0,0 +1,51 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from listings.jobs import claim_next_job, run_job
+from listings.models import Job
+
+
+class Command(BaseCommand):
+    help = "Process background jobs (CSV imports, image processing) from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of waiting for new jobs.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when the queue is empty (default: 2).",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Worker {worker} started"))
+
+        try:
+            while True:
+                close_old_connections()
+                job = claim_next_job(worker)
+
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+
+                self.stdout.write(f"- Running job {job.pk} ({job.kind}, attempt {job.attempts + 1})")
+                run_job(job)
+
+                job.refresh_from_db()
+                style = self.style.SUCCESS if job.status == Job.STATUS_SUCCEEDED else self.style.WARNING
+                self.stdout.write(style(f"  job {job.pk}: {job.status} {job.message}".rstrip()))
+        except KeyboardInterrupt:
+            # a job interrupted here stays "running" until its heartbeat goes stale, then another worker retries it
+            self.stdout.write(self.style.WARNING("Worker stopped."))
@@ -1,45 +1,11 @@
-import csv
 import os
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Dict, List, Tuple
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.core.files import File
 from django.db import transaction
 
-from listings.models import Location, Property, PropertyImage
-
-
-def _parse_bool(value: str) -> bool:
-    """
-    Accepts: true/false, 1/0, yes/no (case-insensitive).
-    """
-    v = (value or "").strip().lower()
-    if v in {"true", "1", "yes", "y"}:
-        return True
-    if v in {"false", "0", "no", "n", ""}:
-        return False
-    raise ValueError(f"Invalid boolean value: '{value}' (use true/false)")
-
-
-def _read_csv(path: Path) -> List[dict]:
-    if not path.exists():
-        raise CommandError(f"CSV not found: {path}")
-    with path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        if not reader.fieldnames:
-            raise CommandError(f"CSV has no header: {path}")
-        return list(reader)
-
-
-@dataclass
-class SeedPaths:
-    base_dir: Path
-    locations_csv: Path
-    properties_csv: Path
-    images_csv: Path
+from listings.ingest import CsvSeeder, IngestError, SeedPaths, SeedRows
+from listings.models import Job
 
 
 class Command(BaseCommand):
@@ -71,15 +37,19 @@ class Command(BaseCommand):
             action="store_true",
             help="Danger: clears existing Location/Property/PropertyImage before seeding.",
         )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the import for `run_worker` (small committed batches) instead of running it here in one transaction.",
+        )
 
     def handle(self, *args, **options):
-        base_dir = Path(options["base"]).resolve()
-        paths = SeedPaths(
-            base_dir=base_dir,
-            locations_csv=base_dir / options["locations"],
-            properties_csv=base_dir / options["properties"],
-            images_csv=base_dir / options["images"],
-        )
+        if options["clear"] and options["background"]:
+            # batches commit one by one: live requests would see an empty, half imported catalogue meanwhile,
+            # and a failed or cancelled job would leave it empty
+            raise CommandError("--clear can't be combined with --background. Clear with a synchronous import.")
+
+        paths = SeedPaths.from_options(options["base"], options["locations"], options["properties"], options["images"])
 
         self.stdout.write(self.style.MIGRATE_HEADING("Seeding from CSV..."))
         self.stdout.write(f"- Base: {paths.base_dir}")
@@ -88,159 +58,45 @@ class Command(BaseCommand):
         self.stdout.write(f"- Images: {paths.images_csv}")
         self.stdout.write(f"- MEDIA_ROOT: {settings.MEDIA_ROOT}")
 
-        # Read CSVs first (fail early with good errors)
-        locations_rows = _read_csv(paths.locations_csv)
-        properties_rows = _read_csv(paths.properties_csv)
-        images_rows = _read_csv(paths.images_csv)
+        try:
+            rows = SeedRows.load(paths)
+        except IngestError as e:
+            raise CommandError(str(e))
+
+        if options["background"]:
+            job = Job.enqueue(
+                Job.KIND_SEED_CSV,
+                {
+                    "base": str(paths.base_dir),
+                    "locations": options["locations"],
+                    "properties": options["properties"],
+                    "images": options["images"],
+                    # image file_paths in the csv are relative to where this command runs, not to the worker
+                    "root": os.getcwd(),
+                },
+                progress_total=rows.total,
+            )
+            self.stdout.write(self.style.SUCCESS(f"✅ Queued import as job {job.pk}. Run `manage.py run_worker` to process it."))
+            return
 
-        # Basic header validation (prevents silent wrong imports)
-        self._require_headers(paths.locations_csv, locations_rows, {"name"})
-        self._require_headers(paths.properties_csv, properties_rows, {
-            "external_id", "location_name", "property_name", "country", "address", "title", "description"
-        })
-        self._require_headers(paths.images_csv, images_rows, {
-            "property_external_id", "file_path", "is_primary", "alt_text"
-        })
+        seeder = CsvSeeder()
+        try:
+            seeder.check_primary_images(rows.images)
 
-        with transaction.atomic():
-            if options["clear"]:
-                self._clear_existing()
+            with transaction.atomic():
+                if options["clear"]:
+                    seeder.clear_existing()
+                    self.stdout.write(self.style.WARNING("⚠️ Cleared existing data."))
 
-            locations = self._seed_locations(locations_rows)
-            properties = self._seed_properties(properties_rows, locations)
-            self._seed_images(images_rows, properties)
+                seeder.seed_locations(rows.locations)
+                self.stdout.write(self.style.SUCCESS(f"Locations seeded: {len(seeder.locations)}"))
 
-        self.stdout.write(self.style.SUCCESS("✅ Seeding completed successfully."))
+                seeder.seed_properties(rows.properties)
+                self.stdout.write(self.style.SUCCESS(f"Properties seeded: {len(seeder.properties)}"))
 
-    def _require_headers(self, path: Path, rows: List[dict], required: set):
-        if not rows:
-            raise CommandError(f"CSV is empty (no rows): {path}")
-        headers = set(rows[0].keys())
-        missing = required - headers
-        if missing:
-            raise CommandError(f"CSV missing columns {sorted(missing)}: {path}")
-
-    def _clear_existing(self):
-        # Order matters due to FK constraints
-        PropertyImage.objects.all().delete()
-        Property.objects.all().delete()
-        Location.objects.all().delete()
-        self.stdout.write(self.style.WARNING("⚠️ Cleared existing data."))
-
-    def _seed_locations(self, rows: List[dict]) -> Dict[str, Location]:
-        """
-        Returns a map: location_name -> Location object
-        """
-        out: Dict[str, Location] = {}
-        for i, r in enumerate(rows, start=2):  # start=2 because header is line 1
-            name = (r.get("name") or "").strip()
-            if not name:
-                raise CommandError(f"locations.csv line {i}: 'name' is required")
-
-            # get_or_create avoids duplicates if you seed multiple times without --clear
-            loc, _ = Location.objects.get_or_create(name=name)
-            out[name.lower()] = loc  # store normalized for easy lookup
-
-        self.stdout.write(self.style.SUCCESS(f"Locations seeded: {len(out)}"))
-        return out
-
-    def _seed_properties(self, rows: List[dict], locations: Dict[str, Location]) -> Dict[str, Property]:
-        """
-        Returns a map: external_id -> Property object
-        """
-        out: Dict[str, Property] = {}
-        for i, r in enumerate(rows, start=2):
-            external_id = (r.get("external_id") or "").strip()
-            location_name = (r.get("location_name") or "").strip()
-            if not external_id:
-                raise CommandError(f"properties.csv line {i}: 'external_id' is required")
-            if not location_name:
-                raise CommandError(f"properties.csv line {i}: 'location_name' is required")
-
-            loc = locations.get(location_name.lower())
-            if not loc:
-                raise CommandError(
-                    f"properties.csv line {i}: unknown location_name='{location_name}'. "
-                    f"Add it to locations.csv."
-                )
-
-            # Create or update by external_id (stable key)
-            obj, _ = Property.objects.update_or_create(
-                external_id=external_id,
-                defaults={
-                    "location": loc,
-                    "property_name": (r.get("property_name") or "").strip(),
-                    "country": (r.get("country") or "").strip(),
-                    "address": (r.get("address") or "").strip(),
-                    "title": (r.get("title") or "").strip(),
-                    "description": (r.get("description") or "").strip(),
-                },
-            )
+                seeder.seed_images(rows.images)
+                self.stdout.write(self.style.SUCCESS(f"Images seeded: {seeder.images_created}"))
+        except IngestError as e:
+            raise CommandError(str(e))
 
-            out[external_id] = obj
-
-        self.stdout.write(self.style.SUCCESS(f"Properties seeded: {len(out)}"))
-        return out
-
-    def _seed_images(self, rows: List[dict], properties: Dict[str, Property]):
-        """
-        Copies files into MEDIA_ROOT through ImageField saving.
-        Enforces: only one primary image per property.
-        """
-        # Track primary per property (fail fast if CSV is wrong)
-        primary_seen: Dict[str, int] = {}
-
-        created = 0
-        for i, r in enumerate(rows, start=2):
-            prop_ext = (r.get("property_external_id") or "").strip()
-            file_path = (r.get("file_path") or "").strip()
-            alt_text = (r.get("alt_text") or "").strip()
-
-            if not prop_ext:
-                raise CommandError(f"images.csv line {i}: 'property_external_id' is required")
-            if not file_path:
-                raise CommandError(f"images.csv line {i}: 'file_path' is required")
-
-            prop = properties.get(prop_ext)
-            if not prop:
-                raise CommandError(
-                    f"images.csv line {i}: unknown property_external_id='{prop_ext}'. "
-                    f"Add it to properties.csv."
-                )
-
-            try:
-                is_primary = _parse_bool(r.get("is_primary", "false"))
-            except ValueError as e:
-                raise CommandError(f"images.csv line {i}: {e}")
-
-            if is_primary:
-                primary_seen[prop_ext] = primary_seen.get(prop_ext, 0) + 1
-                if primary_seen[prop_ext] > 1:
-                    raise CommandError(
-                        f"images.csv invalid: property '{prop_ext}' has more than one primary image."
-                    )
-
-            src = Path(file_path).resolve()
-            if not src.exists():
-                raise CommandError(
-                    f"images.csv line {i}: file not found: '{file_path}' (resolved to {src})"
-                )
-            if src.is_dir():
-                raise CommandError(f"images.csv line {i}: file_path points to a directory: {src}")
-
-            # If the same CSV is imported twice, avoid duplicating identical entries:
-            # (simple approach: check by filename + property)
-            existing = PropertyImage.objects.filter(property=prop, alt_text=alt_text, is_primary=is_primary)
-            # NOTE: this is intentionally simple; you can tighten later.
-            if existing.exists():
-                continue
-
-            img_obj = PropertyImage(property=prop, is_primary=is_primary, alt_text=alt_text)
-
-            # Save file into the ImageField; Django will copy it into MEDIA_ROOT using upload_to()
-            with src.open("rb") as f:
-                img_obj.image.save(src.name, File(f), save=True)
-
-            created += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Images seeded: {created}"))
+        self.stdout.write(self.style.SUCCESS("✅ Seeding completed successfully."))
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-19 02:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_location_property_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProperty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='listings.property')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listings.property')),
+            ],
+            options={
+                'ordering': ['property', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('property', 'rank'), name='unique_similar_rank')],
+            },
+        ),
+    ]
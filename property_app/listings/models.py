@@ -4,9 +4,13 @@ from django.db import models
 import os
 import uuid
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.text import slugify  #slugify is used to create url-friendly slugs from strings.
 
+from .placeholders import compute_placeholder
+
 # generating dynamic file location for images for each property
 def property_image_upload_path(instance: "PropertyImage", filename: str):
     """
@@ -24,6 +28,8 @@ class Location(models.Model):
     name = models.CharField(max_length=120, unique=True)
     slug = models.SlugField(max_length=140, unique=True, blank=True)
 
+    updated_at = models.DateTimeField(auto_now=True) # lets publish_static republish only what changed
+
     class Meta:
         ordering = ["name"]
     
@@ -49,6 +55,7 @@ class Property(models.Model):
     slug = models.SlugField(max_length=200, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # also touched when one of its images changes (see signals.py)
 
     class Meta:
         ordering = ["-created_at"]
@@ -84,9 +91,19 @@ class PropertyImage(models.Model):
     image = models.ImageField(upload_to=property_image_upload_path)
     is_primary = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=150, blank=True)
+
+    # low quality placeholder, computed once from the file so list responses can paint cards instantly
+    placeholder = models.TextField(blank=True, editable=False) # tiny base64 jpeg data uri, or PLACEHOLDER_FAILED
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False) # "#rrggbb"
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # stored instead of a data uri when pillow can't read the file, so it isn't queued again on every save
+    PLACEHOLDER_FAILED = "failed"
+    PLACEHOLDER_FIELDS = ("placeholder", "dominant_color", "width", "height")
+
     class Meta:
         ordering = ["-is_primary", "created_at"]
     
@@ -103,7 +120,127 @@ class PropertyImage(models.Model):
     
     def save(self, *args, **kwargs):
         self.full_clean()
+
+        # a new file means the old placeholder, colour and size are stale (and a failed file gets another try)
+        if self.pk and self.image:
+            old_name = PropertyImage.objects.filter(pk=self.pk).values_list("image", flat=True).first()
+            if old_name != self.image.name:
+                self.placeholder = ""
+                self.dominant_color = ""
+                self.width = None
+                self.height = None
+
         super().save(*args, **kwargs)
+
+        # computed after saving, so the file is already committed to storage and can be re-opened.
+        # Pillow work stays off the request path: the worker (manage.py run_worker) picks it up,
+        # unless the caller is already a background process (seed import) and sets process_inline.
+        if self.image and not self.placeholder:
+            if getattr(self, "process_inline", False) or not getattr(settings, "IMAGE_PROCESSING_IN_BACKGROUND", True):
+                self.refresh_placeholder()
+            else:
+                Job.enqueue(Job.KIND_IMAGE_PLACEHOLDER, {"image_id": self.pk})
+
+    def refresh_placeholder(self):
+        try:
+            with self.image.open("rb") as f:
+                data = compute_placeholder(f)
+        except (OSError, ValueError):
+            # unreadable or not an image pillow understands: keep serving it without a placeholder
+            data = {"placeholder": self.PLACEHOLDER_FAILED, "dominant_color": "", "width": None, "height": None}
+
+        for field, value in data.items():
+            setattr(self, field, value)
+        super().save(update_fields=list(data))
+
+    def has_placeholder(self) -> bool:
+        return bool(self.placeholder) and self.placeholder != self.PLACEHOLDER_FAILED
     
     def __str__(self):
-        return f"Image for {self.property.external_id} (primary={self.is_primary})"
\ No newline at end of file
+        return f"Image for {self.property.external_id} (primary={self.is_primary})"
+
+class SimilarProperty(models.Model):
+    """
+    Precomputed nearest neighbours of a property (built by `manage.py build_similar`).
+    One row per (property, rank), so /api/properties/<id>/similar/ is a single indexed lookup.
+    """
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name="similar_links")
+    similar = models.ForeignKey(Property, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField() # 1 = most similar
+    score = models.FloatField() # cosine similarity of the feature vectors
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["property", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["property", "rank"], name="unique_similar_rank"),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id} ~ {self.similar_id} (#{self.rank}, {self.score:.3f})"
+
+
+class Job(models.Model):
+    """
+    A unit of background work (CSV imports, image processing) stored in the database
+    and executed by `manage.py run_worker`. See listings/jobs.py for the handlers.
+    """
+    KIND_SEED_CSV = "seed_csv"
+    KIND_IMAGE_PLACEHOLDER = "image_placeholder"
+    KIND_CHOICES = [
+        (KIND_SEED_CSV, "CSV import"),
+        (KIND_IMAGE_PLACEHOLDER, "Image placeholder"),
+    ]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_CANCELLED, "Cancelled"),
+    ]
+
+    kind = models.CharField(max_length=40, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True) # current step, for the admin
+    error = models.TextField(blank=True)
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    cancel_requested = models.BooleanField(default=False)
+
+    run_after = models.DateTimeField(default=timezone.now) # retries are delayed with a backoff
+    worker = models.CharField(max_length=100, blank=True) # which worker claimed it
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # a running job without heartbeat is considered dead
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+        ]
+
+    @classmethod
+    def enqueue(cls, kind: str, payload: dict, **fields) -> "Job":
+        return cls.objects.create(kind=kind, payload=payload, **fields)
+
+    @property
+    def progress_percent(self):
+        if not self.progress_total:
+            return None
+        return round(100 * self.progress_done / self.progress_total)
+
+    def __str__(self):
+        return f"Job {self.pk} {self.kind} ({self.status})"
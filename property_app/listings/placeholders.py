@@ -0,0 +1,40 @@
+import base64
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+PLACEHOLDER_SIZE = (20, 20) # longest side of the thumbnail embedded in api responses
+PLACEHOLDER_QUALITY = 50
+
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def compute_placeholder(file_obj) -> dict:
+    """
+    Builds a low quality image placeholder for an image file.
+    Returns the tiny thumbnail as a base64 jpeg data uri, the average colour as #rrggbb and the intrinsic size,
+    so the client can paint a card with the right aspect ratio before the full image arrives.
+    """
+    with Image.open(file_obj) as img:
+        width, height = img.size
+        if img.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+            width, height = height, width # displayed rotated by 90 degrees
+
+        # draft() lets the jpeg decoder downscale while decoding, which is much cheaper than a full decode
+        img.draft("RGB", (PLACEHOLDER_SIZE[0] * 4, PLACEHOLDER_SIZE[1] * 4))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+        img.thumbnail(PLACEHOLDER_SIZE)
+        dominant = img.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=PLACEHOLDER_QUALITY, optimize=True)
+
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return {
+        "placeholder": f"data:image/jpeg;base64,{encoded}",
+        "dominant_color": "#{:02x}{:02x}{:02x}".format(*dominant),
+        "width": width,
+        "height": height,
+    }
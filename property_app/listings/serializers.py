@@ -10,10 +10,11 @@ class LocationSerializer(serializers.ModelSerializer):
 # propertyImage model serializer
 class PropertyImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField() # helps to create a field in JSON that doesn't exist directly in our database model.
+    placeholder = serializers.SerializerMethodField()
 
     class Meta:
         model = PropertyImage
-        fields = ["id", "image_url", "is_primary", "alt_text"]
+        fields = ["id", "image_url", "is_primary", "alt_text", "width", "height", "dominant_color", "placeholder"]
 
     def get_image_url(self, obj):
         request = self.context.get("request") # by accessing the request from context, serializer get's the website domain.
@@ -25,6 +26,9 @@ class PropertyImageSerializer(serializers.ModelSerializer):
 
         # combines the domain with the image path 
         return request.build_absolute_uri(url) if request else url
+
+    def get_placeholder(self, obj):
+        return obj.placeholder if obj.has_placeholder() else ""
     
 class PropertyListSerializer(serializers.ModelSerializer):
     """
@@ -33,6 +37,7 @@ class PropertyListSerializer(serializers.ModelSerializer):
     location_name = serializers.CharField(source="location.name", read_only=True)
     location_slug = serializers.CharField(source="location.slug", read_only=True)
     primary_image_url = serializers.SerializerMethodField()
+    primary_image_placeholder = serializers.SerializerMethodField() # lets the card paint before the image downloads
 
     class Meta:
         model = Property
@@ -46,13 +51,18 @@ class PropertyListSerializer(serializers.ModelSerializer):
             "location_name",
             "location_slug",
             "primary_image_url",
+            "primary_image_placeholder",
         ]
+
+    def _get_primary_image(self, obj):
+        # searching through related images of a single property instance to find the primary image.
+        # iterating .all() reuses the prefetched images instead of running one query per property.
+        return next((img for img in obj.images.all() if img.is_primary), None)
     
     def get_primary_image_url(self, obj):
         request = self.context.get("request")
 
-        # searching through related images of a single property instance to find the primary image.
-        primary = obj.images.filter(is_primary=True).first()
+        primary = self._get_primary_image(obj)
         
         if not primary or not primary.image:
             return None
@@ -60,6 +70,19 @@ class PropertyListSerializer(serializers.ModelSerializer):
         url = primary.image.url
         return request.build_absolute_uri(url) if request else url
 
+    def get_primary_image_placeholder(self, obj):
+        primary = self._get_primary_image(obj)
+
+        if not primary or not primary.has_placeholder():
+            return None
+
+        return {
+            "placeholder": primary.placeholder,
+            "dominant_color": primary.dominant_color,
+            "width": primary.width,
+            "height": primary.height,
+        }
+
 
 class PropertyDetailSerializer(serializers.ModelSerializer):
     """
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .coalescing import coalescer
+from .models import Location, Property, PropertyImage
+from .slug_cache import slug_cache
+
+
+# keeping the detail page slug cache in sync with the database.
+# A location slug is part of every property url in it, and a new property can answer a cached 404,
+# so any change drops everything; these models change rarely compared to how often pages are viewed.
+@receiver([post_save, post_delete], sender=Property)
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_slugs(sender, **kwargs):
+    slug_cache.invalidate()
+
+
+# cached search / autocomplete results embed property, location and image data
+@receiver([post_save, post_delete], sender=Property)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=PropertyImage)
+def invalidate_cached_results(sender, **kwargs):
+    coalescer.bump_version()
+
+
+# an image change is a change of its property's published payloads
+@receiver([post_save, post_delete], sender=PropertyImage)
+def touch_property_on_image_change(sender, instance, **kwargs):
+    Property.objects.filter(pk=instance.property_id).update(updated_at=timezone.now())
@@ -0,0 +1,93 @@
+import math
+import re
+import zlib
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+")
+
+# how much each field counts; location / country are whole-value tokens so "same city" weighs in as one strong feature
+FIELD_WEIGHTS = {
+    "title": 2.0,
+    "property_name": 1.5,
+    "description": 1.0,
+}
+LOCATION_WEIGHT = 3.0
+COUNTRY_WEIGHT = 1.0
+
+
+def _bucket(token: str, dim: int) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+def property_features(row: dict) -> Dict[str, float]:
+    """
+    Weighted term counts for one property row (values() dict with title, description, property_name,
+    location__name and country).
+    """
+    counts: Dict[str, float] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in TOKEN_RE.findall((row.get(field) or "").lower()):
+            counts[token] = counts.get(token, 0.0) + weight
+
+    location = (row.get("location__name") or "").strip().lower()
+    if location:
+        counts[f"location:{location}"] = LOCATION_WEIGHT
+    country = (row.get("country") or "").strip().lower()
+    if country:
+        counts[f"country:{country}"] = COUNTRY_WEIGHT
+    return counts
+
+
+def build_vectors(rows: Sequence[dict], dim: int) -> np.ndarray:
+    """
+    Hashed TF-IDF vectors, L2 normalised, so a dot product is the cosine similarity.
+    Returns an array of shape (len(rows), dim).
+    """
+    matrix = np.zeros((len(rows), dim), dtype=np.float32)
+
+    for i, row in enumerate(rows):
+        for token, weight in property_features(row).items():
+            # sublinear tf keeps long descriptions from drowning out the title
+            matrix[i, _bucket(token, dim)] += 1.0 + math.log(weight)
+
+    if len(rows):
+        df = np.count_nonzero(matrix, axis=0)
+        idf = np.log((1.0 + len(rows)) / (1.0 + df)) + 1.0
+        matrix *= idf.astype(np.float32)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+    return matrix
+
+
+def top_k_neighbours(vectors: np.ndarray, row_indexes: Iterable[int], k: int, chunk_size: int = 512) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    For each requested row index: [(neighbour index, score), ...] best first, excluding the row itself.
+    Works in chunks so the similarity matrix never holds more than chunk_size x N scores.
+    """
+    row_indexes = list(row_indexes)
+    out: Dict[int, List[Tuple[int, float]]] = {}
+    n = vectors.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return {i: [] for i in row_indexes}
+
+    for start in range(0, len(row_indexes), chunk_size):
+        chunk = np.asarray(row_indexes[start:start + chunk_size])
+        scores = vectors[chunk] @ vectors.T
+        scores[np.arange(len(chunk)), chunk] = -np.inf # never its own neighbour
+
+        # argpartition finds the top k without sorting the whole row, then only those k are sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for row, idx, sc in zip(chunk.tolist(), top.tolist(), top_scores.tolist()):
+            out[row] = list(zip(idx, sc))
+    return out
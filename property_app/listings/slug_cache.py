@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .coalescing import bump_counter, get_counter
+
+MISSING = object() # returned by get() when the key isn't cached at all
+GENERATION_KEY = "listings:slugs:generation"
+
+
+class SlugResolutionCache:
+    """
+    In-process LRU cache for (location_slug, property_slug) -> property id.
+    Misses are cached too (value None) with a much shorter ttl, so bots hammering stale urls
+    get their 404 without a database query.
+    Every entry remembers the generation it was resolved under. The generation is a counter in the shared cache,
+    bumped by signals on any Property / Location change in any process (web, worker, seed command),
+    so entries made before the change are ignored everywhere, not only in the process that made it.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float, cache_alias: str = "default"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+        self._entries: OrderedDict = OrderedDict() # key -> (property_id or None, expires_at, generation)
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return get_counter(caches[self.cache_alias], GENERATION_KEY)
+
+    def get(self, location_slug: str, property_slug: str, generation: int):
+        key = (location_slug, property_slug)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+
+            property_id, expires_at, entry_generation = entry
+            if entry_generation != generation or expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING
+
+            self._entries.move_to_end(key) # most recently used
+            return property_id
+
+    def set(self, location_slug: str, property_slug: str, property_id, generation: int):
+        """`generation` must be read before the database lookup, so a change made meanwhile isn't masked."""
+        ttl = self.ttl if property_id is not None else self.negative_ttl
+        key = (location_slug, property_slug)
+        with self._lock:
+            self._entries[key] = (property_id, time.monotonic() + ttl, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # evict the least recently used
+
+    def invalidate(self):
+        """A slug may have changed, or a new property may now answer a url that used to 404."""
+        bump_counter(caches[self.cache_alias], GENERATION_KEY)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+slug_cache = SlugResolutionCache(
+    max_entries=getattr(settings, "SLUG_CACHE_MAX_ENTRIES", 10000),
+    ttl=getattr(settings, "SLUG_CACHE_TTL", 300),
+    negative_ttl=getattr(settings, "SLUG_CACHE_NEGATIVE_TTL", 30),
+    cache_alias=getattr(settings, "SLUG_CACHE_ALIAS", "default"),
+)
@@ -6,6 +6,7 @@ const metaEl = document.getElementById("searchMeta");
 const paginationEl = document.getElementById("pagination");
 
 let selectedLocationName = "";
+let selectedLocationSlug = ""; // known when picked from the suggestions, lets us use the published pages
 let currentPage = 1;
 
 function escapeHtml(str) {
@@ -25,19 +26,69 @@ function showSuggestions(items) {
     }
 
     suggestionsBox.innerHTML = items
-        .map((loc) => `<div class="suggestion" data-name="${escapeHtml(loc.name)}">${escapeHtml(loc.name)}</div>`)
+        .map((loc) => `<div class="suggestion" data-name="${escapeHtml(loc.name)}" data-slug="${escapeHtml(loc.slug)}">${escapeHtml(loc.name)}</div>`)
         .join("");
     suggestionsBox.classList.remove("hidden");
 }
 
+// the whole location list, fetched once and filtered locally so typing doesn't hit the server.
+// Versioned urls are cached as immutable, so repeat visits don't even revalidate until a location changes.
+let locationIndexPromise = null;
+
+function getLocationIndex() {
+    if (!locationIndexPromise) {
+        const query = LOCATION_INDEX_VERSION ? `?v=${encodeURIComponent(LOCATION_INDEX_VERSION)}` : "";
+        locationIndexPromise = fetch(`/api/locations/index/${query}`)
+            .then((res) => (res.ok ? res.json() : null))
+            .catch(() => null);
+    }
+    return locationIndexPromise;
+}
+
 async function fetchSuggestions(q) {
+    const index = await getLocationIndex();
+
+    // same matching as the server: case-insensitive "contains", ordered by name, first 5
+    if (index && index.complete) {
+        const needle = q.toLowerCase();
+        return index.results
+            .filter(([name]) => name.toLowerCase().includes(needle))
+            .slice(0, 5)
+            .map(([name, slug]) => ({ name, slug }));
+    }
+
+    // index too large (or unavailable): ask the server
     const res = await fetch(`/api/locations/autocomplete/?q=${encodeURIComponent(q)}`);
     const data = await res.json();
     return data.results || [];
 }
 
-async function fetchProperties(locationName, page) {
-    const url = `/api/properties/?location=${encodeURIComponent(locationName)}&page=${page}`;
+async function findLocationSlug(name) {
+    const index = await getLocationIndex();
+    const needle = name.toLowerCase();
+    const match = index && index.results.find(([n]) => n.toLowerCase() === needle);
+    return match ? match[1] : "";
+}
+
+// search pages pre-rendered by `manage.py publish_static`, served by the front server without Django
+async function publishedFirstPageUrl(slug) {
+    if (!PUBLISH_URL || !slug) return null;
+    try {
+        const res = await fetch(`${PUBLISH_URL}current/version.json`, { cache: "no-cache" });
+        if (!res.ok) return null;
+        const { version } = await res.json();
+        // a fixed version directory: next / previous are relative to the page, so paging stays in this version
+        return `${PUBLISH_URL}versions/${version}/search/${encodeURIComponent(slug)}/page-1.json`;
+    } catch {
+        return null;
+    }
+}
+
+function apiSearchUrl(locationName, page) {
+    return `/api/properties/?location=${encodeURIComponent(locationName)}&page=${page}`;
+}
+
+async function fetchProperties(url) {
     const res = await fetch(url);
     if (!res.ok) {
         const err = await res.json().catch(() => null);
@@ -46,11 +97,30 @@ async function fetchProperties(locationName, page) {
     return await res.json();
 }
 
+async function fetchFirstPage() {
+    const slug = selectedLocationSlug || (await findLocationSlug(selectedLocationName));
+    const publishedUrl = await publishedFirstPageUrl(slug);
+    if (publishedUrl) {
+        // missing when the location was added after the last publish: ask the api instead
+        const data = await fetchProperties(publishedUrl).catch(() => null);
+        if (data) return { url: publishedUrl, data };
+    }
+    const url = apiSearchUrl(selectedLocationName, 1);
+    return { url, data: await fetchProperties(url) };
+}
+
 function renderProperties(items) {
     resultsEl.innerHTML = items.map((p) => {
+        // the inline placeholder paints immediately, the real image covers it once downloaded
+        const ph = p.primary_image_placeholder;
+        const phStyle = ph
+            ? `style="background-color:${escapeHtml(ph.dominant_color)};background-image:url('${ph.placeholder}');background-size:cover"`
+            : "";
+        const phSize = ph && ph.width && ph.height ? `width="${ph.width}" height="${ph.height}"` : "";
+
         const img = p.primary_image_url
-            ? `<img class="card-img" src="${p.primary_image_url}" alt="Primary image">`
-            : `<div class="card-img"></div>`;
+            ? `<img class="card-img" src="${p.primary_image_url}" alt="Primary image" loading="lazy" ${phSize} ${phStyle}>`
+            : `<div class="card-img" ${phStyle}></div>`;
 
         return `
       <a class="card" href="/properties/${p.location_slug}/${p.slug}/">
@@ -65,26 +135,31 @@ function renderProperties(items) {
     }).join("");
 }
 
-function renderPagination(next, previous) {
+function renderPagination(next, previous, baseUrl) {
+    // published pages link relatively, the api absolutely
+    const base = new URL(baseUrl, window.location.href);
+    const nextUrl = next && new URL(next, base).href;
+    const previousUrl = previous && new URL(previous, base).href;
+
     paginationEl.innerHTML = "";
 
     const prevBtn = document.createElement("button");
     prevBtn.className = "page-btn";
     prevBtn.textContent = "Previous";
-    prevBtn.disabled = !previous;
-    prevBtn.onclick = () => loadPage(currentPage - 1);
+    prevBtn.disabled = !previousUrl;
+    prevBtn.onclick = () => loadPage(currentPage - 1, previousUrl);
 
     const nextBtn = document.createElement("button");
     nextBtn.className = "page-btn";
     nextBtn.textContent = "Next";
-    nextBtn.disabled = !next;
-    nextBtn.onclick = () => loadPage(currentPage + 1);
+    nextBtn.disabled = !nextUrl;
+    nextBtn.onclick = () => loadPage(currentPage + 1, nextUrl);
 
     paginationEl.appendChild(prevBtn);
     paginationEl.appendChild(nextBtn);
 }
 
-async function loadPage(page) {
+async function loadPage(page, url) {
     if (!selectedLocationName) return;
     currentPage = page;
     metaEl.textContent = "Loading...";
@@ -92,10 +167,13 @@ async function loadPage(page) {
     paginationEl.innerHTML = "";
 
     try {
-        const data = await fetchProperties(selectedLocationName, page);
+        // page 1 picks the source; later pages follow its next / previous links
+        const first = url ? null : await fetchFirstPage();
+        const pageUrl = url || first.url;
+        const data = first ? first.data : await fetchProperties(pageUrl);
         metaEl.textContent = `Showing ${data.results.length} results (page ${currentPage}) for "${selectedLocationName}"`;
         renderProperties(data.results);
-        renderPagination(data.next, data.previous);
+        renderPagination(data.next, data.previous, pageUrl);
     } catch (e) {
         metaEl.textContent = e.message;
     }
@@ -105,6 +183,7 @@ let debounceTimer = null;
 input.addEventListener("input", () => {
     const q = input.value.trim();
     selectedLocationName = ""; // reset until user selects or searches
+    selectedLocationSlug = "";
 
     clearTimeout(debounceTimer);
     debounceTimer = setTimeout(async () => {
@@ -131,6 +210,7 @@ input.addEventListener("keydown", (e) => {
         const name = first.getAttribute("data-name");
         input.value = name;
         selectedLocationName = name;
+        selectedLocationSlug = first.getAttribute("data-slug") || "";
     } else {
         selectedLocationName = q;
     }
@@ -145,6 +225,7 @@ suggestionsBox.addEventListener("click", (e) => {
     const name = el.getAttribute("data-name");
     input.value = name;
     selectedLocationName = name;
+    selectedLocationSlug = el.getAttribute("data-slug") || "";
     showSuggestions([]);
     loadPage(1);
 });
@@ -163,5 +244,6 @@ searchBtn.addEventListener("click", () => {
         return;
     }
     selectedLocationName = q;
+    selectedLocationSlug = ""; // looked up in the location index
     loadPage(1);
 });
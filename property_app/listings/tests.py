@@ -1,3 +1,847 @@
-from django.test import TestCase
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from .coalescing import ResultCoalescer
+from .compression import ENCODERS, choose_encoding
+from .ingest import IngestError
+from .jobs import HANDLERS, claim_next_job, run_job
+from .models import Job, Location, Property, PropertyImage, SimilarProperty
+from .slug_cache import GENERATION_KEY, slug_cache
+from .throttling import take_tokens
+from .views_media import _parse_range
+
+# tests never touch the file based cache the running app uses
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "listings-tests"}}
+
+
+class TempMediaMixin:
+    """Points MEDIA_ROOT at a temporary directory for the duration of each test."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+def jpeg_file(color=(200, 30, 30), size=(64, 48)) -> ContentFile:
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ApiTestCase(TestCase):
+    """Empty in-memory cache for every test, so throttle buckets and cached results don't leak between tests."""
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_satisfiable(self):
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=900-": (900, 999),
+            "bytes=500-5000": (500, 999), # end past the file is clamped
+            "bytes=-100": (900, 999),
+            "bytes=-5000": (0, 999), # suffix longer than the file: whole file
+            "bytes=999-999": (999, 999),
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(_parse_range(header, 1000), expected)
+
+    def test_unsatisfiable(self):
+        for header, size in [("bytes=1000-", 1000), ("bytes=5-1", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)]:
+            with self.subTest(header=header, size=size):
+                self.assertIs(_parse_range(header, size), False)
+
+    def test_ignored(self):
+        # malformed, other units and multi-range requests are answered with the full file
+        for header in ["", "bytes=-", "items=0-1", "bytes=0-1,5-6", "bytes=a-b"]:
+            with self.subTest(header=header):
+                self.assertIsNone(_parse_range(header, 1000))
+
+
+@override_settings(MEDIA_SENDFILE_HEADER=None, MEDIA_CACHE_MAX_AGE=600)
+class ServeMediaTests(TempMediaMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.name = f"properties/P1/{'a' * 32}.jpg"
+        (self.media_root / "properties/P1").mkdir(parents=True)
+        (self.media_root / self.name).write_bytes(bytes(range(256)) * 4)
+
+    def test_full_file_is_cached_forever(self):
+        response = self.client.get(f"/media/{self.name}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_other_files_get_max_age(self):
+        (self.media_root / "logo.png").write_bytes(b"png")
+        response = self.client.get("/media/logo.png")
+        response.close()
+        self.assertEqual(response["Cache-Control"], "public, max-age=600")
+
+    def test_etag_revalidation(self):
+        first = self.client.get(f"/media/{self.name}")
+        first.close()
+
+        response = self.client.get(f"/media/{self.name}", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+    def test_range(self):
+        response = self.client.get(f"/media/{self.name}", HTTP_RANGE="bytes=10-19")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+
+        response = self.client.get(f"/media/{self.name}", HTTP_RANGE="bytes=5000-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_stale_if_range_gets_the_full_file(self):
+        response = self.client.get(f"/media/{self.name}", HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"old"')
+        response.close()
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE_HEADER="X-Accel-Redirect", MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/")
+    def test_accel_redirect(self):
+        response = self.client.get(f"/media/{self.name}")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get("/media/properties/P1/nope.jpg").status_code, 404)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+
+
+class PropertyBatchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rome = Location.objects.create(name="Rome")
+        self.villa = Property.objects.create(external_id="P1", location=self.rome, title="Villa")
+        self.flat = Property.objects.create(external_id="P2", location=self.rome, title="Flat")
+
+    def test_requested_order_and_missing(self):
+        with self.assertNumQueries(2): # properties + all of their images
+            response = self.client.get(f"/api/properties/batch/?ids={self.flat.pk},999,{self.villa.pk},{self.flat.pk}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["id"] for p in response.json()["results"]], [self.flat.pk, self.villa.pk])
+        self.assertEqual(response.json()["missing"], [999])
+
+    def test_external_ids(self):
+        response = self.client.get("/api/properties/batch/?external_ids=P2,NOPE")
+        self.assertEqual([p["external_id"] for p in response.json()["results"]], ["P2"])
+        self.assertEqual(response.json()["missing"], ["NOPE"])
+
+    def test_list_filters_are_ignored(self):
+        response = self.client.get(f"/api/properties/batch/?ids={self.villa.pk}&location=Nowhere")
+        self.assertEqual([p["id"] for p in response.json()["results"]], [self.villa.pk])
+        self.assertEqual(response.json()["missing"], [])
+
+    def test_invalid_requests(self):
+        for query in ["", "ids=1&external_ids=P1", "ids=1,x", "ids=" + ",".join(str(i) for i in range(51))]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/properties/batch/?{query}").status_code, 400)
+
+
+class PlaceholderTests(TempMediaMixin, ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rome = Location.objects.create(name="Rome")
+        self.villa = Property.objects.create(external_id="P1", location=self.rome, title="Villa")
+
+    def add_image(self, content, name="photo.jpg", **fields) -> PropertyImage:
+        image = PropertyImage(property=self.villa, is_primary=True, **fields)
+        image.image.save(name, content, save=True)
+        return image
+
+    @override_settings(IMAGE_PROCESSING_IN_BACKGROUND=False)
+    def test_computed_inline(self):
+        image = self.add_image(jpeg_file())
+
+        self.assertTrue(image.placeholder.startswith("data:image/jpeg;base64,"))
+        self.assertEqual((image.width, image.height), (64, 48))
+        self.assertRegex(image.dominant_color, r"^#[0-9a-f]{6}$")
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(IMAGE_PROCESSING_IN_BACKGROUND=True)
+    def test_computed_by_the_worker(self):
+        image = self.add_image(jpeg_file())
+        self.assertEqual(image.placeholder, "")
+
+        job = claim_next_job("test")
+        self.assertEqual((job.kind, job.payload), (Job.KIND_IMAGE_PLACEHOLDER, {"image_id": image.pk}))
+        run_job(job)
+
+        image.refresh_from_db()
+        self.assertTrue(image.has_placeholder())
+
+    @override_settings(IMAGE_PROCESSING_IN_BACKGROUND=True)
+    def test_unreadable_image_is_not_queued_again(self):
+        image = self.add_image(ContentFile(b"not an image"))
+        run_job(claim_next_job("test"))
+
+        image.refresh_from_db()
+        self.assertEqual(image.placeholder, PropertyImage.PLACEHOLDER_FAILED)
+        self.assertFalse(image.has_placeholder())
+
+        image.alt_text = "edited"
+        image.save()
+        self.assertIsNone(claim_next_job("test"))
+
+        detail = self.client.get(f"/api/properties/{self.villa.pk}/").json()
+        self.assertEqual(detail["images"][0]["placeholder"], "")
+
+    @override_settings(IMAGE_PROCESSING_IN_BACKGROUND=False)
+    def test_new_file_resets_every_field(self):
+        image = self.add_image(jpeg_file())
+
+        image.image.save("other.jpg", ContentFile(b"broken"), save=True)
+
+        image.refresh_from_db()
+        self.assertEqual(image.placeholder, PropertyImage.PLACEHOLDER_FAILED)
+        self.assertEqual((image.dominant_color, image.width, image.height), ("", None, None))
+
+    @override_settings(IMAGE_PROCESSING_IN_BACKGROUND=False)
+    def test_list_embeds_the_primary_placeholder(self):
+        self.add_image(jpeg_file())
+        flat = Property.objects.create(external_id="P2", location=self.rome, title="Flat")
+
+        with self.assertNumQueries(3): # count, page, images of the page
+            results = self.client.get("/api/properties/?location=Rome").json()["results"]
+
+        by_id = {p["id"]: p for p in results}
+        placeholder = by_id[self.villa.pk]["primary_image_placeholder"]
+        self.assertEqual((placeholder["width"], placeholder["height"]), (64, 48))
+        self.assertTrue(placeholder["placeholder"].startswith("data:image/jpeg;base64,"))
+        self.assertIsNone(by_id[flat.pk]["primary_image_placeholder"])
+
+
+class PropertyDetailPageTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        slug_cache.clear()
+        self.rome = Location.objects.create(name="Rome")
+        self.villa = Property.objects.create(external_id="P1", location=self.rome, title="Villa")
+        self.url = f"/properties/rome/{self.villa.slug}/"
+
+    def test_resolved_slug_skips_the_database(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, f"const PROPERTY_ID = {self.villa.pk};")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_unknown_slug_is_cached_until_a_property_changes(self):
+        url = "/properties/rome/new-house-99/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        house = Property.objects.create(external_id="P2", location=self.rome, title="New house")
+        self.assertEqual(self.client.get(f"/properties/rome/{house.slug}/").status_code, 200)
+
+    def test_change_made_by_another_process(self):
+        self.client.get(self.url)
+
+        # what a signal in the worker / seed command does: only the shared counter moves, this process' LRU stays
+        caches["default"].incr(GENERATION_KEY)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_renamed_slug(self):
+        self.client.get(self.url)
+
+        self.villa.slug = "grand-villa"
+        self.villa.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get("/properties/rome/grand-villa/").status_code, 200)
+
+    def test_location_rename_drops_everything(self):
+        self.client.get(self.url)
+
+        self.rome.slug = "roma"
+        self.rome.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(f"/properties/roma/{self.villa.slug}/").status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResultCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.coalescer = ResultCoalescer(cache_alias="default", ttl=60, stale_ttl=0, lock_timeout=5)
+
+    def test_waiters_get_the_leaders_error(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            raise RuntimeError("database is locked")
+
+        errors = []
+
+        def request():
+            try:
+                self.coalescer.get_or_compute("key", compute)
+            except RuntimeError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=request)
+        leader.start()
+        started.wait(5)
+
+        waiter = threading.Thread(target=request)
+        waiter.start()
+        wait_until(lambda: self.coalescer.stats()["collapsed"] == 1)
+        release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(self.coalescer.stats()["errors"], 1)
+        self.assertEqual(self.coalescer.stats()["in_flight"], 0)
+
+    def test_error_is_not_cached(self):
+        with self.assertRaises(RuntimeError):
+            self.coalescer.get_or_compute("key", mock.Mock(side_effect=RuntimeError))
+
+        self.assertEqual(self.coalescer.get_or_compute("key", lambda: "ok"), "ok")
+        self.assertEqual(self.coalescer.get_or_compute("key", lambda: "not called"), "ok")
+
+    def test_bump_version_changes_keys(self):
+        version = self.coalescer.version()
+        self.coalescer.bump_version()
+        self.assertNotEqual(self.coalescer.version(), version)
+
+        # an evicted counter must not come back as a value that was already used
+        caches["default"].clear()
+        self.assertGreater(self.coalescer.version(), version)
+
+
+class SearchCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rome = Location.objects.create(name="Rome")
+        Property.objects.create(external_id="P1", location=self.rome, title="Villa")
+
+    def test_results_are_cached_until_data_changes(self):
+        url = "/api/properties/?location=Rome"
+        self.assertEqual(self.client.get(url).json()["count"], 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()["count"], 1)
+
+        Property.objects.create(external_id="P2", location=self.rome, title="Flat")
+        self.assertEqual(self.client.get(url).json()["count"], 2)
+
+    def test_autocomplete_is_cached(self):
+        self.client.get("/api/locations/autocomplete/?q=rom")
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/locations/autocomplete/?q=rom")
+        self.assertEqual(response.json()["results"][0]["name"], "Rome")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PublishStaticTests(TestCase):
+    def setUp(self):
+        self.out = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.out)
+
+        self.rome = Location.objects.create(name="Rome")
+        self.oslo = Location.objects.create(name="Oslo")
+        self.villa = Property.objects.create(external_id="P1", location=self.rome, title="Villa")
+        self.flat = Property.objects.create(external_id="P2", location=self.rome, title="Flat")
+        self.cabin = Property.objects.create(external_id="P3", location=self.oslo, title="Cabin")
+
+    def publish(self, *args) -> str:
+        out = StringIO()
+        call_command("publish_static", "--out", str(self.out), *args, stdout=out)
+        return out.getvalue()
+
+    def inode(self, path: Path) -> int:
+        return os.stat(path).st_ino
+
+    def test_versions_and_current_symlink(self):
+        self.publish()
+        current = self.out / "current"
+
+        self.assertEqual(os.readlink(current), os.path.join("versions", "1"))
+        self.assertEqual(json.loads((current / "version.json").read_text()), {"version": 1})
+        self.assertTrue((current / f"api/properties/{self.villa.pk}/index.json.gz").exists())
+        self.assertTrue((current / "search/oslo/page-1.json").exists())
+
+    @override_settings(REST_FRAMEWORK={"PAGE_SIZE": 1})
+    def test_search_pages_link_relatively(self):
+        self.publish()
+        current = self.out / "current"
+
+        first = json.loads((current / "search/rome/page-1.json").read_text())
+        second = json.loads((current / "search/rome/page-2.json").read_text())
+        self.assertEqual((first["count"], first["next"], first["previous"]), (2, "page-2.json", None))
+        self.assertEqual((second["next"], second["previous"]), (None, "page-1.json"))
+
+    def test_incremental_only_rerenders_changes(self):
+        self.publish()
+        v1 = (self.out / "current").resolve()
+
+        self.villa.title = "Big villa"
+        self.villa.save()
+        cabin_pk = self.cabin.pk
+        self.cabin.delete()
+        self.publish()
+        v2 = (self.out / "current").resolve()
+
+        manifest = json.loads((v2 / "manifest.json").read_text())
+        self.assertEqual(manifest["version"], 2)
+        self.assertNotIn(str(cabin_pk), manifest["properties"])
+
+        # changed property and its location page are new files; the untouched property is the same file
+        villa = f"api/properties/{self.villa.pk}/index.json"
+        flat = f"api/properties/{self.flat.pk}/index.json"
+        self.assertNotEqual(self.inode(v2 / villa), self.inode(v1 / villa))
+        self.assertNotEqual(self.inode(v2 / "search/rome/page-1.json"), self.inode(v1 / "search/rome/page-1.json"))
+        self.assertEqual(self.inode(v2 / flat), self.inode(v1 / flat))
+        self.assertIn("Big villa", (v2 / villa).read_text())
+
+        # the deleted property's payload is gone from the new version only, and its (now empty) location re-rendered
+        self.assertFalse((v2 / f"api/properties/{cabin_pk}/index.json").exists())
+        self.assertTrue((v1 / f"api/properties/{cabin_pk}/index.json").exists())
+        self.assertEqual(json.loads((v2 / "search/oslo/page-1.json").read_text())["count"], 0)
+
+    def test_page_size_change_republishes_everything(self):
+        self.publish()
+        self.assertIn("incremental", self.publish())
+
+        with override_settings(REST_FRAMEWORK={"PAGE_SIZE": 1}):
+            output = self.publish()
+
+        self.assertIn("Mode: full", output)
+        self.assertTrue((self.out / "current/search/rome/page-2.json").exists())
+
+    def test_old_versions_are_pruned(self):
+        for _ in range(3):
+            self.publish("--keep", "2")
+
+        self.assertEqual(sorted(p.name for p in (self.out / "versions").iterdir()), ["2", "3"])
+
+
+@override_settings(LOCATION_INDEX_MAX_AGE=300)
+class LocationIndexTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        Location.objects.create(name="Rome")
+        Location.objects.create(name="Oslo")
+
+    def test_payload_and_etag(self):
+        response = self.client.get("/api/locations/index/")
+        data = response.json()
+
+        self.assertEqual(data["results"], [["Oslo", "oslo"], ["Rome", "rome"]])
+        self.assertTrue(data["complete"])
+        self.assertEqual(response["ETag"], f'"{data["version"]}"')
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+
+    def test_revalidation(self):
+        etag = self.client.get("/api/locations/index/")["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/locations/index/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # compressed responses carry a weak etag, which must match too
+        response = self.client.get("/api/locations/index/", HTTP_IF_NONE_MATCH=f"W/{etag}")
+        self.assertEqual(response.status_code, 304)
+
+    def test_versioned_url_is_immutable(self):
+        version = self.client.get("/api/locations/index/").json()["version"]
+
+        response = self.client.get(f"/api/locations/index/?v={version}")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+
+        # an outdated version gets the current data, but not cached forever
+        response = self.client.get("/api/locations/index/?v=0000")
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+        self.assertEqual(response.json()["version"], version)
+
+    def test_version_follows_the_data(self):
+        version = self.client.get("/api/locations/index/").json()["version"]
+        Location.objects.create(name="Lima")
+        self.assertNotEqual(self.client.get("/api/locations/index/").json()["version"], version)
+
+    @override_settings(LOCATION_INDEX_MAX_ENTRIES=1)
+    def test_too_many_locations(self):
+        data = self.client.get("/api/locations/index/").json()
+        self.assertEqual((data["complete"], data["results"]), (False, []))
+
+    def test_home_page_links_the_current_version(self):
+        version = self.client.get("/api/locations/index/").json()["version"]
+        self.assertContains(self.client.get("/"), f'const LOCATION_INDEX_VERSION = "{version}";')
+
+
+class ChooseEncodingTests(SimpleTestCase):
+    def test_q_values(self):
+        with mock.patch.dict(ENCODERS, {"br": None, "gzip": None}, clear=True):
+            self.assertEqual(choose_encoding("gzip, br"), "br") # same q: server preference
+            self.assertEqual(choose_encoding("gzip;q=1.0, br;q=0.5"), "gzip")
+            self.assertEqual(choose_encoding("br;q=0, *"), "gzip")
+            self.assertEqual(choose_encoding("deflate, identity"), None)
+            self.assertEqual(choose_encoding("gzip;q=0"), None)
+            self.assertEqual(choose_encoding(""), None)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        rome = Location.objects.create(name="Rome")
+        for i in range(10):
+            Property.objects.create(external_id=f"P{i}", location=rome, title=f"Villa with a view {i}")
+
+        # only gzip, so the outcome does not depend on which optional encoders are installed
+        self.gzip = mock.Mock(side_effect=lambda body: gzip.compress(body, mtime=0))
+        patcher = mock.patch.dict(ENCODERS, {"gzip": self.gzip}, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_gzip(self):
+        plain = self.client.get("/api/properties/")
+        response = self.client.get("/api/properties/", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertIn("Accept-Encoding", plain["Vary"])
+        self.assertFalse(plain.has_header("Content-Encoding"))
+
+    def test_etag_becomes_weak(self):
+        for i in range(20):
+            Location.objects.create(name=f"Town {i}")
+        etag = self.client.get("/api/locations/index/")["ETag"]
+
+        response = self.client.get("/api/locations/index/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], f"W/{etag}")
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get("/api/locations/autocomplete/?q=rom", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_html_is_not_compressed(self):
+        response = self.client.get("/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_compressed_body_is_cached_with_the_result(self):
+        first = self.client.get("/api/properties/", HTTP_ACCEPT_ENCODING="gzip")
+        second = self.client.get("/api/properties/", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(self.gzip.call_count, 1)
+        self.assertEqual(second.content, first.content)
+
+        # a data change moves the result to a new key, so the stale compressed body is never served
+        Property.objects.create(external_id="P10", location=Location.objects.get(), title="Flat")
+        third = self.client.get("/api/properties/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(self.gzip.call_count, 2)
+        self.assertEqual(json.loads(gzip.decompress(third.content))["count"], 11)
+
+
+class BuildSimilarTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        location = Location.objects.create(name="Lisbon")
+        titles = ["sea view apartment", "sea view studio", "mountain cabin", "mountain chalet", "city loft"]
+        self.props = [
+            Property.objects.create(external_id=f"P{i}", location=location, title=title)
+            for i, title in enumerate(titles)
+        ]
+
+    def build(self, *args) -> str:
+        out = StringIO()
+        call_command("build_similar", "--k", "2", "--dim", "256", *args, stdout=out)
+        return out.getvalue()
+
+    def test_full_build(self):
+        self.build("--full")
+
+        for prop in self.props:
+            self.assertEqual(SimilarProperty.objects.filter(property=prop).count(), 2)
+        top = SimilarProperty.objects.get(property=self.props[0], rank=1)
+        self.assertEqual(top.similar_id, self.props[1].pk)
+
+    def test_nothing_changed(self):
+        self.build()
+        self.assertIn("Changed: 0, lists to refresh: 0", self.build())
+
+    def test_changed_and_new_properties(self):
+        self.build()
+
+        self.props[4].title = "sea view loft"
+        self.props[4].save()
+        new = Property.objects.create(external_id="P9", location=self.props[0].location, title="mountain hut")
+        output = self.build()
+
+        self.assertIn("Changed: 2", output)
+        self.assertEqual(SimilarProperty.objects.filter(property=new).count(), 2)
+        self.assertIn(self.props[4].pk, SimilarProperty.objects.filter(property=self.props[0]).values_list("similar_id", flat=True))
+
+    def test_similar_endpoint(self):
+        self.build("--full")
+
+        with self.assertNumQueries(2): # links with properties and locations + their images
+            response = self.client.get(f"/api/properties/{self.props[0].pk}/similar/")
+        results = response.json()["results"]
+        self.assertEqual(results[0]["id"], self.props[1].pk)
+        self.assertGreaterEqual(results[0]["score"], results[1]["score"])
+
+    def test_similar_endpoint_not_found(self):
+        for pk in ["abc", "999"]:
+            with self.subTest(pk=pk):
+                self.assertEqual(self.client.get(f"/api/properties/{pk}/similar/").status_code, 404)
+
+        # an existing property without a list yet is not an error
+        response = self.client.get(f"/api/properties/{self.props[0].pk}/similar/")
+        self.assertEqual(response.json(), {"results": []})
+
+
+@override_settings(CACHES=TEST_CACHES, JOB_RETRY_DELAY=10, JOB_STALE_AFTER=300)
+class JobQueueTests(TestCase):
+    def test_claims_oldest_due_job(self):
+        first = Job.enqueue("test", {})
+        second = Job.enqueue("test", {})
+        Job.enqueue("test", {}, run_after=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(claim_next_job("a").pk, first.pk)
+        self.assertEqual(claim_next_job("b").pk, second.pk)
+        self.assertIsNone(claim_next_job("c"))
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.worker), (Job.STATUS_RUNNING, "a"))
+
+    def test_job_claimed_meanwhile_is_skipped(self):
+        first = Job.enqueue("test", {})
+        second = Job.enqueue("test", {})
+        update = QuerySet.update
+        raced = []
+
+        def claim_first_elsewhere(qs, **kwargs):
+            # another worker wins the first candidate between our SELECT and our UPDATE
+            if not raced:
+                raced.append(1)
+                update(Job.objects.filter(pk=first.pk), status=Job.STATUS_RUNNING, worker="other", heartbeat_at=timezone.now())
+            return update(qs, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", autospec=True, side_effect=claim_first_elsewhere):
+            claimed = claim_next_job("me")
+
+        self.assertEqual(claimed.pk, second.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.worker, "other")
+
+    def test_stale_running_job_is_claimed_again(self):
+        job = Job.enqueue("test", {}, status=Job.STATUS_RUNNING, worker="dead", heartbeat_at=timezone.now() - timedelta(minutes=10))
+        Job.enqueue("test", {}, status=Job.STATUS_RUNNING, worker="alive", heartbeat_at=timezone.now())
+
+        self.assertEqual(claim_next_job("me").pk, job.pk)
+        self.assertIsNone(claim_next_job("me"))
+
+    def test_stale_job_on_its_last_attempt_fails(self):
+        # the worker died during attempt 3 of 3, e.g. because the job itself crashes it
+        job = Job.enqueue("test", {}, status=Job.STATUS_RUNNING, worker="dead", attempts=3, heartbeat_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertIsNone(claim_next_job("me"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_retries_with_exponential_backoff(self):
+        job = Job.enqueue("boom", {})
+
+        with mock.patch.dict(HANDLERS, {"boom": mock.Mock(side_effect=RuntimeError("disk full"))}):
+            for attempt, delay in [(1, 10), (2, 20)]:
+                before = timezone.now()
+                run_job(claim_next_job("me") or Job.objects.get(pk=job.pk))
+                job.refresh_from_db()
+
+                self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, attempt))
+                self.assertAlmostEqual((job.run_after - before).total_seconds(), delay, delta=2)
+                self.assertIn("disk full", job.error)
+                self.assertIsNone(claim_next_job("me")) # not due yet
+
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+            run_job(claim_next_job("me"))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_bad_data_is_not_retried(self):
+        job = Job.enqueue("bad", {})
+
+        with mock.patch.dict(HANDLERS, {"bad": mock.Mock(side_effect=IngestError("images.csv line 3: bad"))}):
+            run_job(claim_next_job("me"))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.message), (Job.STATUS_FAILED, 1, "images.csv line 3: bad"))
+
+    def test_clear_is_refused_in_background(self):
+        job = Job.enqueue(Job.KIND_SEED_CSV, {"clear": True})
+        run_job(claim_next_job("me"))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TakeTokensTests(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.now = 1_000_000.0
+        patcher = mock.patch("listings.throttling.time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill(self):
+        for _ in range(3):
+            self.assertEqual(take_tokens("bucket", rate=2, burst=3), (True, 0.0))
+
+        allowed, wait = take_tokens("bucket", rate=2, burst=3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+
+        self.now += 0.25 # half a token back
+        allowed, wait = take_tokens("bucket", rate=2, burst=3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.25)
+
+        self.now += 0.25
+        self.assertTrue(take_tokens("bucket", rate=2, burst=3)[0])
+
+    def test_refill_is_capped_at_burst(self):
+        take_tokens("bucket", rate=1, burst=2)
+        self.now += 3600
+
+        self.assertTrue(take_tokens("bucket", rate=1, burst=2)[0])
+        self.assertTrue(take_tokens("bucket", rate=1, burst=2)[0])
+        self.assertFalse(take_tokens("bucket", rate=1, burst=2)[0])
+
+    def test_cost(self):
+        self.assertTrue(take_tokens("bucket", rate=1, burst=4, cost=3)[0])
+
+        allowed, wait = take_tokens("bucket", rate=1, burst=4, cost=3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 2.0) # 1 token left, 2 more needed
+        self.assertTrue(take_tokens("bucket", rate=1, burst=4, cost=1)[0]) # a refused request takes nothing
+
+    def test_cost_above_burst_is_capped(self):
+        self.assertEqual(take_tokens("bucket", rate=2, burst=4, cost=50), (True, 0.0))
+
+        allowed, wait = take_tokens("bucket", rate=2, burst=4, cost=50)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 2.0) # a full bucket, not 50 tokens that never come
+
+        self.now += wait
+        self.assertTrue(take_tokens("bucket", rate=2, burst=4, cost=50)[0])
+
+
+
+def take_in_child(results, attempts):
+    from django.db import connections
+    connections.close_all() # the parent's sqlite connection must not be shared
+
+    results.put(sum(take_tokens("shared", rate=0.001, burst=100)[0] for _ in range(attempts)))
+
+
+class TakeTokensAcrossProcessesTests(SimpleTestCase):
+    def test_workers_share_one_budget(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root)
+        # a file based cache like in production: only the lock file keeps the workers' updates apart
+        file_cache = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": root / "cache"}}
+
+        with override_settings(CACHES=file_cache, THROTTLE_LOCK_FILE=root / "cache/throttle.lock"):
+            context = multiprocessing.get_context("fork")
+            results = context.Queue()
+            workers = [context.Process(target=take_in_child, args=(results, 60)) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            allowed = sum(results.get(timeout=30) for _ in workers)
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(allowed, 100)
+
+@override_settings(
+    THROTTLE_CLIENT_BUDGETS={"default": (5, 20)},
+    THROTTLE_GLOBAL_BUDGETS={},
+    THROTTLE_DEEP_PAGE_STEP=10,
+)
+class DeepPageThrottleTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1_000_000.0
+        patcher = mock.patch("listings.throttling.time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deepest_page_is_reachable(self):
+        # page 999 would cost 100 tokens, more than the bucket ever holds
+        self.assertEqual(self.client.get("/api/properties/?page=999").status_code, 404) # past the end, but not throttled
+
+        response = self.client.get("/api/properties/?page=999")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "4") # 20 tokens at 5 per second
+
+        self.now += 4
+        self.assertEqual(self.client.get("/api/properties/?page=999").status_code, 404)
 
-# Create your tests here.
@@ -0,0 +1,278 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import fcntl  # not available on windows
+except ImportError:
+    fcntl = None
+
+DEFAULT_SCOPE = "default"
+
+
+class ThrottleStats:
+    """Process local counters, exposed through /api/metrics/."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, name: str):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+
+class InFlightCounter:
+    """
+    Requests currently being processed by this process. With sync / threaded wsgi workers this can't exceed
+    the thread count (the backlog waits in the server, see QueueTime); asgi servers have no such bound.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def try_enter(self, limit: Optional[int]) -> bool:
+        with self._lock:
+            if limit is not None and self.current >= limit:
+                return False
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.current -= 1
+
+
+class QueueTime:
+    """How long requests waited before this process picked them up (from X-Request-Start), in ms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last = None
+        self.peak = 0.0
+
+    def record(self, ms: float):
+        with self._lock:
+            self.last = ms
+            self.peak = max(self.peak, ms)
+
+
+def queue_time_ms(request) -> Optional[float]:
+    """
+    Time between the front server receiving the request and now, from its X-Request-Start header:
+    "t=<seconds.millis>" as nginx's $msec gives it, or milliseconds / microseconds since the epoch (other proxies).
+    None without the header.
+    """
+    raw = request.META.get("HTTP_X_REQUEST_START", "").strip().removeprefix("t=")
+    try:
+        started = float(raw)
+    except ValueError:
+        return None
+
+    # the unit is told apart by magnitude
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (time.time() - started) * 1000)
+
+
+stats = ThrottleStats()
+in_flight = InFlightCounter()
+queue_time = QueueTime()
+_bucket_lock = threading.Lock()
+
+
+@contextmanager
+def _bucket_locked():
+    """
+    Serializes bucket updates: the cache backends have no atomic read-modify-write, and lost updates would let
+    every worker process spend the whole global budget. The process lock covers threads, an flock on
+    THROTTLE_LOCK_FILE the other processes of this host. Without that setting (or fcntl) only threads are covered.
+    """
+    with _bucket_lock:
+        path = getattr(settings, "THROTTLE_LOCK_FILE", None)
+        if path is None or fcntl is None:
+            yield
+            return
+
+        # opened per call: a descriptor inherited through fork would share its lock with the parent
+        try:
+            lock_file = open(path, "ab")
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock_file = open(path, "ab")
+
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def take_tokens(key: str, rate: float, burst: float, cost: float = 1.0):
+    """
+    Token bucket kept in the throttle cache: refills `rate` tokens per second up to `burst`.
+    Returns (allowed, seconds until `cost` tokens are available).
+    A cost above `burst` could never be paid, it is capped: such a request needs a full bucket, which it empties.
+    Read-modify-write runs under _bucket_locked(), so buckets are exact for all workers of one host
+    (with the default file based cache, that is everything sharing the buckets anyway).
+    """
+    cache = caches[getattr(settings, "THROTTLE_CACHE_ALIAS", "default")]
+    cost = min(cost, burst)
+
+    with _bucket_locked():
+        now = time.time() # after waiting for the lock, so updated_at never goes backwards
+        tokens, updated_at = cache.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+
+        # once it could have refilled completely the entry is equivalent to a missing one, let it expire
+        cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+
+    wait = 0.0 if allowed else (cost - tokens) / rate
+    return allowed, wait
+
+
+def view_scope(view) -> str:
+    """'<basename>.<action>' for viewsets (e.g. 'locations.autocomplete'), so every action can get its own budget."""
+    basename = getattr(view, "basename", None)
+    action = getattr(view, "action", None)
+    if basename and action:
+        return f"{basename}.{action}"
+    return getattr(view, "throttle_scope", None) or DEFAULT_SCOPE
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base for the token bucket throttles. Subclasses pick the budgets setting and the bucket key.
+    Runs in APIView.initial(), before the handler, so a throttled request never reaches the database.
+    """
+    budgets_setting = None
+    stats_prefix = None
+
+    def allow_request(self, request, view):
+        # DRF asks every throttle; a request refused by an earlier bucket shouldn't drain the later ones
+        if getattr(request, "_token_bucket_refused", False):
+            return True
+
+        budgets = getattr(settings, self.budgets_setting, {})
+        scope = view_scope(view)
+        budget = budgets.get(scope) or budgets.get(DEFAULT_SCOPE)
+        if not budget:
+            return True
+
+        rate, burst = budget
+        allowed, self._wait = take_tokens(self.get_key(request, scope), rate, burst, self.get_cost(request, scope))
+        stats.incr(f"{self.stats_prefix}.{scope}.{'allowed' if allowed else 'throttled'}")
+        if not allowed:
+            request._token_bucket_refused = True
+        return allowed
+
+    def get_key(self, request, scope: str) -> str:
+        raise NotImplementedError
+
+    def get_cost(self, request, scope: str) -> float:
+        # deep pages cost more: paging far into a result set is the expensive pattern for sqlite (large OFFSET)
+        if scope == "properties.list":
+            try:
+                page = int(request.query_params.get("page") or 1)
+            except ValueError:
+                page = 1
+            step = getattr(settings, "THROTTLE_DEEP_PAGE_STEP", 10)
+            return 1.0 + max(page - 1, 0) // step # take_tokens caps it at the bucket's burst
+        return 1.0
+
+    def wait(self):
+        return self._wait
+
+
+class ClientTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per client budget (by ip; doesn't touch the session so it costs no query).
+    get_ident only trusts X-Forwarded-For as far as REST_FRAMEWORK["NUM_PROXIES"] allows.
+    """
+    budgets_setting = "THROTTLE_CLIENT_BUDGETS"
+    stats_prefix = "client"
+
+    def get_key(self, request, scope: str) -> str:
+        return f"throttle:client:{scope}:{self.get_ident(request)}"
+
+
+class GlobalTokenBucketThrottle(TokenBucketThrottle):
+    """Budget shared by every client, caps the total load one endpoint can put on the database."""
+    budgets_setting = "THROTTLE_GLOBAL_BUDGETS"
+    stats_prefix = "global"
+
+    def get_key(self, request, scope: str) -> str:
+        return f"throttle:global:{scope}"
+
+
+class LoadSheddingMiddleware:
+    """
+    Answers API requests with a fast 503 + Retry-After when the server is overloaded. Checked before any other
+    middleware or view runs, so shed requests do no database work and the requests queued behind them can finish.
+
+    Overload is measured where it shows: a worker process with N threads never has more than N requests in progress,
+    the backlog waits in the server's queue. So a request that waited longer than LOAD_SHED_MAX_QUEUE_MS
+    (X-Request-Start, set by the front server) is shed. LOAD_SHED_MAX_IN_FLIGHT additionally caps the requests
+    in progress per process, for asgi servers where nothing else bounds that.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queue_ms = getattr(settings, "LOAD_SHED_MAX_QUEUE_MS", 500)
+        self.max_in_flight = getattr(settings, "LOAD_SHED_MAX_IN_FLIGHT", None)
+        self.retry_after = getattr(settings, "LOAD_SHED_RETRY_AFTER", 1)
+        self.prefixes = tuple(getattr(settings, "LOAD_SHED_PATH_PREFIXES", ("/api/",)))
+        self.exempt = tuple(getattr(settings, "LOAD_SHED_EXEMPT_PATHS", ("/api/metrics/",)))
+
+    def __call__(self, request):
+        if not request.path.startswith(self.prefixes) or request.path.startswith(self.exempt):
+            return self.get_response(request)
+
+        waited = queue_time_ms(request)
+        if waited is not None:
+            queue_time.record(waited)
+            if self.max_queue_ms is not None and waited > self.max_queue_ms:
+                return self._shed("queue_time")
+
+        if not in_flight.try_enter(self.max_in_flight):
+            return self._shed("in_flight")
+
+        try:
+            return self.get_response(request)
+        finally:
+            in_flight.leave()
+
+    def _shed(self, reason: str):
+        stats.incr(f"load_shedding.shed.{reason}")
+        response = JsonResponse(
+            {
+                "success": False,
+                "status_code": 503,
+                "error": {"detail": "Server is busy, please retry shortly."},
+            },
+            status=503,
+        )
+        response["Retry-After"] = str(self.retry_after)
+        return response
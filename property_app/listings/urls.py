@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LocationViewSet, PropertyViewSet
+from .views import LocationViewSet, PropertyViewSet, metrics
 
 
 router = DefaultRouter()
@@ -9,5 +9,6 @@ router.register(r"properties", PropertyViewSet, basename="properties")
 
 
 urlpatterns = [
+    path("metrics/", metrics, name="metrics"),
     path("", include(router.urls)),
 ]
\ No newline at end of file
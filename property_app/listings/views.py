@@ -1,12 +1,17 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.db.models import Q
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import viewsets
-from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action, api_view, throttle_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
-from .models import Location, Property 
+from .coalescing import coalescer
+from .location_index import cached_location_index
+from .models import Location, Property, SimilarProperty
 from .serializers import (LocationSerializer, PropertyListSerializer, PropertyDetailSerializer,)
+from .throttling import in_flight, queue_time, stats as throttle_stats
 
 
 # Create your views here.
@@ -20,23 +25,154 @@ class LocationViewSet(viewsets.ReadOnlyModelViewSet):
         if len(q) < 3:
             return Response({"results": []})
 
-        qs = Location.objects.filter(name__icontains=q).order_by("name")[:5]
-        data = LocationSerializer(qs, many=True).data
-        return Response({"results": data})
+        def compute():
+            qs = Location.objects.filter(name__icontains=q).order_by("name")[:5]
+            return LocationSerializer(qs, many=True).data
+
+        # concurrent identical lookups share one query
+        key = coalescer.make_key("locations:autocomplete", request)
+        data = coalescer.get_or_compute(key, compute)
+        response = Response({"results": data})
+        response.cache_key = key # lets CompressionMiddleware cache the compressed body too
+        return response
+
+    @action(detail=False, methods=["get"], url_path="index")
+    def index(self, request):
+        """
+        The full location list for filtering on the client, so typing needs no requests at all.
+        Requested with ?v=<version> it is served as immutable; without it, clients revalidate with the ETag.
+        """
+        key, data = cached_location_index()
+        etag = quote_etag(data["version"])
+
+        # weak comparison: CompressionMiddleware turns the etag into W/"..." on compressed responses
+        client_etags = [e.removeprefix("W/") for e in parse_etags(request.headers.get("If-None-Match", ""))]
+        if etag in client_etags:
+            response = Response(status=304)
+        else:
+            response = Response(data)
+
+        response["ETag"] = etag
+        response.cache_key = key
+        if request.query_params.get("v") == data["version"]:
+            response["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response["Cache-Control"] = f"public, max-age={getattr(settings, 'LOCATION_INDEX_MAX_AGE', 300)}"
+        return response
 
 
 class PropertyViewSet(viewsets.ReadOnlyModelViewSet):
+    BATCH_MAX_SIZE = 50 # upper limit of properties returned by one batch call
+
     queryset = Property.objects.select_related("location").prefetch_related("images").all() # prefetch_related-> include images in the initial fetch. it optimizes the search function, search results wil load with only 2 db queries.
 
     def get_serializer_class(self):
-        if self.action == "retrieve":
+        if self.action in ("retrieve", "batch"):
             return PropertyDetailSerializer
         return PropertyListSerializer
     
+    def list(self, request, *args, **kwargs):
+        # cached per url; on a miss only one request runs the search, the concurrent ones wait for its result
+        key = coalescer.make_key("properties:list", request)
+        data = coalescer.get_or_compute(key, lambda: super(PropertyViewSet, self).list(request, *args, **kwargs).data)
+        response = Response(data)
+        response.cache_key = key
+        return response
+
     def get_queryset(self):
         qs = super().get_queryset()
         location_name = (self.request.query_params.get("location") or "").strip() #get the location from the url
                          
         if location_name:
             qs = qs.filter(location__name__iexact = location_name)
-        return qs  
\ No newline at end of file
+        return qs
+
+    @action(detail=False, methods=["get"], url_path="batch")
+    def batch(self, request):
+        """
+        Detail payloads for many properties in one call: ?ids=1,2,3 or ?external_ids=PROP-0001,PROP-0002
+        Runs one query for the properties and one for all of their images, instead of one round trip per property.
+        """
+        ids_param = (request.query_params.get("ids") or "").strip()
+        external_ids_param = (request.query_params.get("external_ids") or "").strip()
+
+        if ids_param and external_ids_param:
+            raise ValidationError({"detail": "Use either 'ids' or 'external_ids', not both."})
+
+        if external_ids_param:
+            lookup = "external_id"
+            keys = [k.strip() for k in external_ids_param.split(",") if k.strip()]
+        elif ids_param:
+            lookup = "id"
+            try:
+                keys = [int(k) for k in ids_param.split(",") if k.strip()]
+            except ValueError:
+                raise ValidationError({"ids": "ids must be a comma separated list of integers."})
+        else:
+            raise ValidationError({"detail": "Provide 'ids' or 'external_ids'."})
+
+        keys = list(dict.fromkeys(keys)) # drop duplicates, keep the requested order
+        if not keys:
+            raise ValidationError({"detail": "Provide at least one id."})
+        if len(keys) > self.BATCH_MAX_SIZE:
+            raise ValidationError({"detail": f"At most {self.BATCH_MAX_SIZE} properties can be requested at once."})
+
+        # not self.get_queryset(): the list view's ?location= filter must not hide requested ids
+        qs = super().get_queryset().filter(**{f"{lookup}__in": keys})
+        found = {getattr(prop, lookup): prop for prop in qs}
+
+        properties = [found[k] for k in keys if k in found]
+        missing = [k for k in keys if k not in found]
+
+        data = self.get_serializer(properties, many=True).data
+        return Response({"results": data, "missing": missing})
+
+    @action(detail=True, methods=["get"], url_path="similar")
+    def similar(self, request, pk=None):
+        """
+        Neighbours precomputed by `manage.py build_similar`, most similar first.
+        One indexed lookup on (property, rank) plus the images prefetch, no scoring at request time.
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            # the router accepts any path segment as pk, like retrieve this is a 404, not a 500
+            raise NotFound("No Property matches the given query.")
+
+        links = list(
+            SimilarProperty.objects
+            .filter(property_id=pk)
+            .select_related("similar__location")
+            .prefetch_related("similar__images")
+            .order_by("rank")
+        )
+
+        if not links and not Property.objects.filter(pk=pk).exists():
+            raise NotFound("No Property matches the given query.")
+
+        data = PropertyListSerializer([link.similar for link in links], many=True, context=self.get_serializer_context()).data
+        for item, link in zip(data, links):
+            item["score"] = round(link.score, 4)
+        return Response({"results": data})
+
+
+@api_view(["GET"])
+@throttle_classes([]) # monitoring must keep working while clients are being throttled
+def metrics(request):
+    """
+    Process local counters for monitoring.
+    """
+    return Response({
+        "search_cache": coalescer.stats(),
+        "throttling": throttle_stats.snapshot(),
+        "in_flight": {
+            "current": in_flight.current,
+            "peak": in_flight.peak,
+            "limit": getattr(settings, "LOAD_SHED_MAX_IN_FLIGHT", None),
+        },
+        "queue_ms": {
+            "last": queue_time.last,
+            "peak": queue_time.peak,
+            "limit": getattr(settings, "LOAD_SHED_MAX_QUEUE_MS", 500),
+        },
+    })
@@ -0,0 +1,164 @@
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+# files written by property_image_upload_path: properties/<external_id>/<uuid4 hex>.<ext>
+# the name never gets reused, so the bytes behind a url never change and can be cached forever.
+IMMUTABLE_MEDIA_RE = re.compile(r"^properties/[^/]+/[0-9a-f]{32}\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _resolve_media_file(path: str) -> Path:
+    try:
+        full_path = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404("Media file not found")
+
+    if not full_path.is_file():
+        raise Http404("Media file not found")
+    return full_path
+
+
+def _cache_control_for(path: str) -> str:
+    if IMMUTABLE_MEDIA_RE.match(path):
+        return IMMUTABLE_CACHE_CONTROL
+    max_age = getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)
+    return f"public, max-age={max_age}"
+
+
+def _parse_range(header: str, size: int):
+    """
+    Parses a single "bytes=start-end" range against a file of `size` bytes.
+    Returns (start, end) inclusive, None to ignore the header (serve the full file),
+    or False when the range can't be satisfied.
+    Multi-range requests are answered with the full body, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix range: "bytes=-500" -> the last 500 bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _range_iterator(file_obj, start: int, length: int):
+    with file_obj:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file_obj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path: str, full_path: Path, content_type: str):
+    """
+    Lets the front server (nginx / apache mod_xsendfile) stream the bytes, so python workers
+    only pay for the headers. The front server handles Range on its own in this mode.
+    """
+    header = getattr(settings, "MEDIA_SENDFILE_HEADER", None)
+    if not header:
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if header == "X-Accel-Redirect":
+        prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response[header] = prefix.rstrip("/") + "/" + path
+    else:
+        response[header] = str(full_path)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    full_path = _resolve_media_file(path)
+    stat = full_path.stat()
+
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": _cache_control_for(path),
+    }
+
+    # 304 for If-None-Match / If-Modified-Since, 412 for failed If-Match
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        for key, value in headers.items():
+            conditional[key] = value
+        return conditional
+
+    content_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+
+    response = _sendfile_response(path, full_path, content_type)
+    if response is None:
+        response = _python_file_response(request, full_path, stat.st_size, etag, content_type)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
+
+
+def _python_file_response(request, full_path: Path, size: int, etag: str, content_type: str):
+    range_header = request.headers.get("Range")
+
+    # If-Range: only honour the range when the client's copy is still current
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+
+    byte_range = _parse_range(range_header, size) if range_header else None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(full_path.open("rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _range_iterator(full_path.open("rb"), start, length),
+        status=206,
+        content_type=content_type,
+    )
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -1,15 +1,34 @@
-from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+from .location_index import cached_location_index
 from .models import Property
+from .slug_cache import MISSING, slug_cache
 
 
 def home(request):
-    return render(request, "listings/home.html")
+    return render(request, "listings/home.html", {
+        "publish_url": getattr(settings, "STATIC_PUBLISH_URL", None) or "",
+        # home.js asks for /api/locations/index/?v=<version>, which browsers may cache as immutable
+        "location_index_version": cached_location_index()[1]["version"],
+    })
 
 
 def property_detail_page(request, location_slug, property_slug):
-    prop = get_object_or_404(
-        Property.objects.select_related("location"),
-        location__slug = location_slug,
-        slug = property_slug,
-    )
-    return render(request, "listings/property_detail.html", {"property_id": prop.id})
+    # the page only needs the id (detail.js fetches the rest), so resolved slugs skip the database entirely
+    generation = slug_cache.generation()
+    property_id = slug_cache.get(location_slug, property_slug, generation)
+
+    if property_id is MISSING:
+        property_id = (
+            Property.objects
+            .filter(location__slug = location_slug, slug = property_slug)
+            .values_list("id", flat=True)
+            .first()
+        )
+        slug_cache.set(location_slug, property_slug, property_id, generation) # None is cached as a short lived negative entry
+
+    if property_id is None:
+        raise Http404("No Property matches the given query.")
+
+    return render(request, "listings/property_detail.html", {"property_id": property_id})